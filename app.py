@@ -1,12 +1,17 @@
-from flask import Flask, request, render_template, redirect, url_for, flash, session, jsonify
+from flask import Flask, request, render_template, redirect, url_for, flash, session, jsonify, Response
+from werkzeug.datastructures import ContentRange
 import os
 import multiprocessing
 import threading
 import uuid
 import time
 import json
-from backend import get_songs_url, download_user_library
-from downloader import download_with_tracking
+from backend import get_songs_url, download_user_library, prepare_downloads, confirm_playlist_sync, discard_playlist_sync
+from downloader import DownloadScheduler
+from jobqueue import RedisJobQueue, RemoteScheduler
+from warmup import start_warmup_scheduler, read_watchlist, WARMUP_INTERVAL
+from library import open_index, track_key
+from archive import TarStream, iter_zip
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -15,22 +20,103 @@ app.secret_key = "spotify-dl-secret-key"  # Required for flash and session
 # Global store for tracking download tasks and their progress across requests
 download_tasks = {}
 
+# Task priorities (lower values are downloaded first)
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITIES = {'high': PRIORITY_HIGH, 'normal': PRIORITY_NORMAL, 'low': PRIORITY_LOW}
+INTERACTIVE_TASK_SIZE = 50  # Tasks up to this many songs are treated as interactive by default
+
+# Statuses after which a task no longer changes
+FINISHED_STATUSES = ["completed", "error", "cancelled"]
+
+# Redis URL of a shared job queue; when set, downloads run on worker nodes (see worker.py)
+QUEUE_REDIS_URL = os.environ.get("SPOTIFY_DL_REDIS_URL")
+
+# File with playlist URLs to keep warm in the track cache (one per line)
+WATCHLIST_PATH = os.environ.get("SPOTIFY_DL_WATCHLIST")
+WARMUP_INTERVAL_SECONDS = int(os.environ.get("SPOTIFY_DL_WARMUP_INTERVAL", WARMUP_INTERVAL))
+
+# Shared download pool for all tasks, created on first use
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
 class DownloadTask:
     """
     Class to represent a download task and its progress.
     Each task has a unique ID and maintains its own state.
     """
-    def __init__(self, task_id, total_songs, original_url=""):
+    def __init__(self, task_id, total_songs, original_url="", priority=PRIORITY_NORMAL):
         self.id = task_id                    # Unique task identifier
         self.total = total_songs             # Total number of songs to download
         self.completed = 0                   # Number of songs downloaded so far
-        self.status = "preparing"            # Current status: preparing, processing, downloading, completed, error
+        self.status = "preparing"            # Current status: preparing, processing, downloading, paused, completed, error, cancelled
         self.error = None                    # Error message if any
         self.output_dir = None               # Directory where songs are downloaded to
         self.completion_time = None          # When the task was completed or errored
         self.original_url = original_url     # URL that was requested for download
         self.is_batch = False                # Whether this is a batch download of multiple URLs
         self.sub_tasks = {}                  # For batch downloads to track individual URL progress
+        self.priority = priority             # Scheduling priority, lower values are downloaded first
+        self.files = []                      # Files of this task in output_dir, filled in when it finishes
+
+def get_scheduler():
+    """
+    Get the shared download scheduler, starting its worker pool on first use.
+    With SPOTIFY_DL_REDIS_URL set, jobs are handed to worker nodes instead.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None and QUEUE_REDIS_URL:
+            _scheduler = RemoteScheduler(RedisJobQueue(QUEUE_REDIS_URL))
+        elif _scheduler is None:
+            num_processes = min(multiprocessing.cpu_count(), 5)  # Limit to 5 processes max
+            _scheduler = DownloadScheduler(num_processes)
+        return _scheduler
+
+def task_priority(requested, total_songs):
+    """
+    Work out a task's priority from the form value.
+    'auto' lets small requests jump ahead of large ones.
+    
+    Args:
+        requested: Priority name from the form (auto, high, normal, low)
+        total_songs: Number of songs (or URLs for a batch) in the task
+    """
+    if requested in PRIORITIES:
+        return PRIORITIES[requested]
+    return PRIORITY_HIGH if total_songs <= INTERACTIVE_TASK_SIZE else PRIORITY_LOW
+
+def collect_task_files(output_dir, urls, metadata_list):
+    """
+    List the files in output_dir that belong to a task, using the library's filename index.
+    
+    Args:
+        output_dir: Directory the task downloaded to
+        urls: List of YouTube URLs of the task
+        metadata_list: List of metadata for each song
+    """
+    index = open_index(output_dir)
+    files = []
+    for url, metadata in zip(urls, metadata_list):
+        key = track_key(url, metadata)
+        if index.is_complete(key):
+            files.append(index.filename_for(key))
+    return files
+
+def cancel_download_task(task):
+    """
+    Cancel a task: queued songs are dropped and running downloads are aborted.
+    
+    Returns:
+        True if the task was still active and is now cancelled
+    """
+    if task.status in FINISHED_STATUSES:
+        return False
+    task.status = "cancelled"
+    task.completion_time = time.time()
+    get_scheduler().cancel(task.id)
+    return True
 
 def progress_callback(task_id):
     """
@@ -44,7 +130,7 @@ def progress_callback(task_id):
     if task:
         task.completed += 1
 
-def background_download(task_id, urls, metadata_list, output_dir, num_processes, audio_format, audio_quality):
+def background_download(task_id, urls, metadata_list, output_dir, audio_format, audio_quality):
     """
     Background worker function that handles the actual download process.
     This runs in a separate thread to avoid blocking the main Flask thread.
@@ -54,7 +140,6 @@ def background_download(task_id, urls, metadata_list, output_dir, num_processes,
         urls: List of YouTube URLs to download
         metadata_list: List of metadata for each song
         output_dir: Directory to save the downloaded files to
-        num_processes: Number of parallel download processes to use
         audio_format: Format to convert audio to (mp3, m4a, wav)
         audio_quality: Audio quality/bitrate (128, 192, 256, 320)
     """
@@ -62,24 +147,32 @@ def background_download(task_id, urls, metadata_list, output_dir, num_processes,
     if not task:
         return
     
-    # Update task status to indicate download is starting
-    task.status = "downloading"
-    task.output_dir = output_dir
-    
     try:
-        # Define a mutable counter object that can be updated by callbacks
-        counter = [0]  # Using a list as a mutable container
+        if task.status == "cancelled":
+            return
+        
+        # Update task status to indicate download is starting
+        task.status = "downloading"
+        task.output_dir = output_dir
+        
+        # Songs already in the output directory count as done straight away
+        args_list, skipped = prepare_downloads(urls, metadata_list, output_dir, audio_format, audio_quality)
+        task.completed = skipped
         
         # Create a callback that updates the task's completed count
         def progress_update():
-            counter[0] += 1
-            task.completed = counter[0]
+            task.completed += 1
+        
+        # Queue the songs on the shared scheduler and wait for them to finish
+        succeeded = get_scheduler().run(task_id, args_list, task.priority, progress_update)
+        task.files = collect_task_files(output_dir, urls, metadata_list)
+        
+        if task.status == "cancelled":
+            return
         
-        # Use our helper function for downloading with progress tracking
-        success_count = download_with_tracking(
-            task_id, urls, metadata_list, output_dir, num_processes, 
-            audio_format, audio_quality, progress_update
-        )
+        # Only a fully successful download moves a playlist's sync point forward
+        if succeeded + skipped == len(urls):
+            confirm_playlist_sync(task.original_url, output_dir)
         
         # Make sure the completion count is accurate and update task status
         task.completed = len(urls)
@@ -90,6 +183,9 @@ def background_download(task_id, urls, metadata_list, output_dir, num_processes,
         task.error = str(e)
         task.status = "error"
         task.completion_time = time.time()
+    finally:
+        # Unless it was confirmed above, the playlist listing is not needed any more
+        discard_playlist_sync(task.original_url, output_dir)
 
 @app.route('/')
 def index():
@@ -105,7 +201,7 @@ def index():
     # Verify task actually exists and is still active
     if task_id and task_id in download_tasks:
         task = download_tasks[task_id]
-        if task.status in ["completed", "error"]:
+        if task.status in FINISHED_STATUSES:
             # Task is finished, no need to keep tracking
             session.pop('task_id', None)
             task_id = None
@@ -130,6 +226,8 @@ def download():
     audio_quality = request.form.get('quality', '192')
     custom_output_dir = request.form.get('output_dir', '')
     batch_mode = request.form.get('batch_mode') == 'true'
+    requested_priority = request.form.get('priority', 'auto')
+    full_sync = request.form.get('full_sync') == 'true'
 
     try:
         # Validate input
@@ -147,38 +245,41 @@ def download():
                 return redirect(url_for('index'))
                 
             # Create a batch task to handle multiple URLs
-            return handle_batch_download(urls_list, limit, audio_format, audio_quality, custom_output_dir)
+            return handle_batch_download(urls_list, limit, audio_format, audio_quality, custom_output_dir, requested_priority, full_sync)
         else:
             # Handle single URL download
+            custom_dir = os.path.abspath(custom_output_dir) if custom_output_dir else None
             if url.lower() == 'liked':
                 # Special case for user's liked songs
                 urls, metadata_list, output_dir = download_user_library(limit)
             else:
-                # Normal case for playlists or albums
-                urls, metadata_list, output_dir = get_songs_url(url, limit)
+                # Normal case for playlists or albums; playlists are synced per output directory
+                urls, metadata_list, output_dir = get_songs_url(url, limit, delta=not full_sync, output_dir=custom_dir)
                 
             # Override output directory if specified
-            if custom_output_dir:
-                output_dir = os.path.abspath(custom_output_dir)
+            if custom_dir:
+                output_dir = custom_dir
                 # Create the directory if it doesn't exist
                 os.makedirs(output_dir, exist_ok=True)
 
             # Validate that we have songs to download
             if not urls or len(urls) == 0:
-                session['error'] = "No songs found to download"
+                # Nothing new in the playlist since its last sync (or it is empty); this is
+                # not recorded as a sync if tracks were added but none of them could be resolved
+                confirm_playlist_sync(url, output_dir)
+                session['error'] = "No new songs to download"
                 return redirect(url_for('index'))
 
             # Create a unique task ID and store task info
             task_id = str(uuid.uuid4())
-            task = DownloadTask(task_id, len(urls), url)
+            task = DownloadTask(task_id, len(urls), url, task_priority(requested_priority, len(urls)))
             download_tasks[task_id] = task
             session['task_id'] = task_id
             
             # Start download in background thread
-            num_processes = min(multiprocessing.cpu_count(), 5)  # Limit to 5 processes max
             thread = threading.Thread(
                 target=background_download,
-                args=(task_id, urls, metadata_list, output_dir, num_processes, audio_format, audio_quality)
+                args=(task_id, urls, metadata_list, output_dir, audio_format, audio_quality)
             )
             thread.daemon = True  # Thread will be terminated when main process exits
             thread.start()
@@ -195,7 +296,8 @@ def download():
         session['error'] = f"An unexpected error occurred: {str(e)}"
         return redirect(url_for('index'))
 
-def handle_batch_download(urls_list, limit, audio_format, audio_quality, custom_output_dir):
+def handle_batch_download(urls_list, limit, audio_format, audio_quality, custom_output_dir, requested_priority='auto',
+                          full_sync=False):
     """
     Process a batch of URLs for download.
     Creates a master task and processes each URL in a background thread.
@@ -206,6 +308,8 @@ def handle_batch_download(urls_list, limit, audio_format, audio_quality, custom_
         audio_format: Format to convert audio to (mp3, m4a, wav)
         audio_quality: Audio quality/bitrate (128, 192, 256, 320)
         custom_output_dir: User-specified output directory (optional)
+        requested_priority: Priority name from the form (auto, high, normal, low)
+        full_sync: Process every playlist track even if the playlist was synced before
     """
     # Create a unique batch ID
     batch_id = str(uuid.uuid4())
@@ -216,7 +320,9 @@ def handle_batch_download(urls_list, limit, audio_format, audio_quality, custom_
     os.makedirs(base_output_dir, exist_ok=True)
     
     # Create a master task to track overall progress
-    master_task = DownloadTask(batch_id, len(urls_list))
+    # Batches are bulk work unless a priority was chosen explicitly
+    priority = PRIORITIES.get(requested_priority, PRIORITY_LOW)
+    master_task = DownloadTask(batch_id, len(urls_list), priority=priority)
     master_task.is_batch = True
     master_task.status = "processing"
     master_task.output_dir = base_output_dir
@@ -226,14 +332,14 @@ def handle_batch_download(urls_list, limit, audio_format, audio_quality, custom_
     # Start the batch processing in a background thread
     thread = threading.Thread(
         target=process_batch,
-        args=(batch_id, urls_list, limit, audio_format, audio_quality, base_output_dir)
+        args=(batch_id, urls_list, limit, audio_format, audio_quality, base_output_dir, full_sync)
     )
     thread.daemon = True
     thread.start()
     
     return redirect(url_for('index'))
 
-def process_batch(batch_id, urls_list, limit, audio_format, audio_quality, base_output_dir):
+def process_batch(batch_id, urls_list, limit, audio_format, audio_quality, base_output_dir, full_sync=False):
     """
     Process each URL in a batch and download its content.
     This runs in a background thread.
@@ -245,6 +351,7 @@ def process_batch(batch_id, urls_list, limit, audio_format, audio_quality, base_
         audio_format: Format to convert audio to (mp3, m4a, wav)
         audio_quality: Audio quality/bitrate (128, 192, 256, 320)
         base_output_dir: Directory to save all downloads
+        full_sync: Process every playlist track even if the playlist was synced before
     """
     master_task = download_tasks.get(batch_id)
     
@@ -262,6 +369,8 @@ def process_batch(batch_id, urls_list, limit, audio_format, audio_quality, base_
     try:
         # Process each URL and gather song info
         for url in urls_list:
+            if master_task.status == "cancelled":
+                return
             try:
                 # Create a subfolder for this URL
                 url_name = url.split('/')[-1] if '/' in url else url
@@ -275,7 +384,7 @@ def process_batch(batch_id, urls_list, limit, audio_format, audio_quality, base_
                 if url.lower() == 'liked':
                     song_urls, metadata_list, _ = download_user_library(limit)
                 else:
-                    song_urls, metadata_list, _ = get_songs_url(url, limit)
+                    song_urls, metadata_list, _ = get_songs_url(url, limit, delta=not full_sync, output_dir=base_output_dir)
                 
                 # Add found songs to our lists
                 if song_urls and len(song_urls) > 0:
@@ -292,24 +401,37 @@ def process_batch(batch_id, urls_list, limit, audio_format, audio_quality, base_
         
         # Handle case where no songs were found
         if total_songs == 0:
+            for url in urls_list:
+                confirm_playlist_sync(url, base_output_dir)
             master_task.status = "error"
-            master_task.error = "No songs found to download in any of the URLs"
+            master_task.error = "No new songs to download in any of the URLs"
             master_task.completion_time = time.time()
             return
         
+        # Handle cancellation while the URLs were being processed
+        if master_task.status == "cancelled":
+            return
+        
         # Now download all songs    
         master_task.status = "downloading"
+        args_list, skipped = prepare_downloads(all_urls, all_metadata, base_output_dir, audio_format, audio_quality)
+        master_task.completed = skipped
         
         # Define a progress update callback for the batch
         def batch_progress_update():
             master_task.completed += 1
         
-        # Use a single download operation for all songs
-        num_processes = min(multiprocessing.cpu_count(), 5)  # Limit to 5 processes max
-        download_with_tracking(
-            batch_id, all_urls, all_metadata, base_output_dir, 
-            num_processes, audio_format, audio_quality, batch_progress_update
-        )
+        # Queue all songs on the shared scheduler as one task
+        succeeded = get_scheduler().run(batch_id, args_list, master_task.priority, batch_progress_update)
+        master_task.files = collect_task_files(base_output_dir, all_urls, all_metadata)
+        
+        if master_task.status == "cancelled":
+            return
+        
+        # Only a fully successful batch moves its playlists' sync points forward
+        if succeeded + skipped == total_songs:
+            for url in urls_list:
+                confirm_playlist_sync(url, base_output_dir)
         
         # Mark as completed
         master_task.completed = total_songs
@@ -321,6 +443,10 @@ def process_batch(batch_id, urls_list, limit, audio_format, audio_quality, base_
         master_task.error = str(e)
         master_task.status = "error"
         master_task.completion_time = time.time()
+    finally:
+        # Listings of playlists that were not confirmed above are not needed any more
+        for url in urls_list:
+            discard_playlist_sync(url, base_output_dir)
 
 @app.route('/check_progress/<task_id>')
 def check_progress(task_id):
@@ -345,16 +471,127 @@ def check_progress(task_id):
         'progress': int((task.completed / task.total) * 100) if task.total > 0 else 0,
         'error': task.error,
         'output_dir': task.output_dir,
-        'is_batch': task.is_batch
+        'is_batch': task.is_batch,
+        'priority': task.priority,
+        'export_url': url_for('export_task', task_id=task_id) if task.files else None
     })
 
+@app.route('/export/<task_id>')
+def export_task(task_id):
+    """
+    Stream a finished task's files as an archive.
+    Query parameter `format` selects `tar` (default) or `zip`. Both store the
+    audio uncompressed and are generated chunk by chunk; tar archives have a
+    known size and support Range requests, so interrupted downloads can resume.
+    
+    Args:
+        task_id: The unique identifier for the task
+    """
+    task = download_tasks.get(task_id)
+    if not task:
+        return jsonify({'status': 'not_found'}), 404
+    if task.status not in FINISHED_STATUSES or not task.files:
+        return jsonify({'error': 'Task has no finished files to export'}), 409
+    
+    archive_format = request.args.get('format', 'tar')
+    root_name = os.path.basename(os.path.normpath(task.output_dir)) or 'spotify-dl'
+    
+    if archive_format == 'zip':
+        response = Response(iter_zip(task.output_dir, task.files, root_name), mimetype='application/zip')
+        response.headers['Content-Disposition'] = f'attachment; filename="{task_id}.zip"'
+        return response
+    if archive_format != 'tar':
+        return jsonify({'error': f"Unknown archive format: {archive_format}"}), 400
+    
+    try:
+        archive = TarStream(task.output_dir, task.files, root_name)
+    except OSError as e:
+        return jsonify({'error': f"Files are no longer available: {str(e)}"}), 410
+    
+    # Serve the requested byte range, unless the files changed since the client's copy (If-Range).
+    # Multi-range requests are answered with the whole archive, which RFC 9110 allows.
+    start, stop, status = 0, archive.size, 200
+    byte_range = request.range
+    if_range = request.if_range
+    range_still_valid = (if_range.etag is None and if_range.date is None) or if_range.etag == archive.etag
+    if byte_range and len(byte_range.ranges) == 1 and range_still_valid:
+        bounds = byte_range.range_for_length(archive.size)
+        if bounds is None:
+            response = Response(status=416)
+            response.content_range = ContentRange('bytes', None, None, archive.size)
+            return response
+        start, stop = bounds
+        status = 206
+    
+    response = Response(archive.iter_range(start, stop), status=status, mimetype='application/x-tar', direct_passthrough=True)
+    response.content_length = stop - start
+    response.accept_ranges = 'bytes'
+    response.set_etag(archive.etag)
+    if status == 206:
+        response.content_range = ContentRange('bytes', start, stop, archive.size)
+    response.headers['Content-Disposition'] = f'attachment; filename="{task_id}.tar"'
+    return response
+
+@app.route('/cancel_task/<task_id>', methods=['POST'])
+def cancel_task(task_id):
+    """
+    API endpoint to cancel a task.
+    Queued songs are dropped and downloads in progress are aborted.
+    
+    Args:
+        task_id: The unique identifier for the task
+    """
+    task = download_tasks.get(task_id)
+    if not task:
+        return jsonify({'status': 'not_found'}), 404
+    if not cancel_download_task(task):
+        return jsonify({'success': False, 'error': f"Task is already {task.status}"}), 409
+    return jsonify({'success': True})
+
+@app.route('/pause_task/<task_id>', methods=['POST'])
+def pause_task(task_id):
+    """
+    API endpoint to pause a downloading task.
+    Songs already downloading finish; queued songs wait until the task is resumed.
+    
+    Args:
+        task_id: The unique identifier for the task
+    """
+    task = download_tasks.get(task_id)
+    if not task:
+        return jsonify({'status': 'not_found'}), 404
+    if task.status != "downloading" or not get_scheduler().pause(task_id):
+        return jsonify({'success': False, 'error': f"Task is {task.status}"}), 409
+    task.status = "paused"
+    return jsonify({'success': True})
+
+@app.route('/resume_task/<task_id>', methods=['POST'])
+def resume_task(task_id):
+    """
+    API endpoint to resume a paused task.
+    
+    Args:
+        task_id: The unique identifier for the task
+    """
+    task = download_tasks.get(task_id)
+    if not task:
+        return jsonify({'status': 'not_found'}), 404
+    if task.status != "paused" or not get_scheduler().resume(task_id):
+        return jsonify({'success': False, 'error': f"Task is {task.status}"}), 409
+    task.status = "downloading"
+    return jsonify({'success': True})
+
 @app.route('/clear_task', methods=['POST'])
 def clear_task():
     """
     API endpoint to clear the current task and start a new download.
     Called when the user clicks "Start New Download".
+    A task that is still running is cancelled.
     """
-    session.pop('task_id', None)
+    task_id = session.pop('task_id', None)
+    task = download_tasks.get(task_id) if task_id else None
+    if task:
+        cancel_download_task(task)
     return jsonify({'success': True})
 
 def cleanup_old_tasks():
@@ -365,8 +602,8 @@ def cleanup_old_tasks():
     current_time = time.time()
     for task_id in list(download_tasks.keys()):
         task = download_tasks[task_id]
-        # Remove tasks that are completed/errored and older than 1 hour
-        if task.status in ["completed", "error"] and task.completion_time and current_time - task.completion_time > 3600:
+        # Remove tasks that are finished and older than 1 hour
+        if task.status in FINISHED_STATUSES and task.completion_time and current_time - task.completion_time > 3600:
             del download_tasks[task_id]
 
 def periodic_cleanup():
@@ -384,6 +621,14 @@ if __name__ == "__main__":
     cleanup_thread.daemon = True
     cleanup_thread.start()
     
+    # Keep watched playlists' metadata and YouTube matches warm in the background.
+    # With the reloader on, this module also runs in the watcher process; only warm
+    # up in the child that actually serves requests, or every pass runs twice.
+    debug = True
+    serving = not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+    if WATCHLIST_PATH and serving:
+        start_warmup_scheduler(lambda: read_watchlist(WATCHLIST_PATH), WARMUP_INTERVAL_SECONDS)
+    
     # Start the Flask web server
-    app.run(debug=True, port=5001)
+    app.run(debug=debug, port=5001)
 
@@ -0,0 +1,113 @@
+import os
+import tarfile
+import zipfile
+import hashlib
+
+# Constants for configuration
+ARCHIVE_CHUNK_SIZE = 64 * 1024  # Bytes read from disk and sent per chunk
+
+class TarStream:
+    """
+    Uncompressed tar archive of a set of files, generated on the fly.
+
+    The layout (headers, file data, padding) is fixed before anything is
+    sent, so the total size is known up front and any byte range of the
+    archive can be produced without building the rest of it. Memory use is
+    one chunk regardless of archive size.
+    """
+    def __init__(self, base_dir, filenames, root_name):
+        self.base_dir = base_dir
+        self.segments = []  # (offset, length, header bytes or file path)
+        offset = 0
+        fingerprint = hashlib.sha1()
+        for filename in filenames:
+            path = os.path.join(base_dir, filename)
+            stat = os.stat(path)
+            info = tarfile.TarInfo(f"{root_name}/{filename}")
+            info.size = stat.st_size
+            info.mtime = int(stat.st_mtime)
+            info.mode = 0o644
+            header = info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8")
+            padding = (tarfile.BLOCKSIZE - stat.st_size % tarfile.BLOCKSIZE) % tarfile.BLOCKSIZE
+
+            self.segments.append((offset, len(header), header))
+            offset += len(header)
+            self.segments.append((offset, stat.st_size, path))
+            offset += stat.st_size
+            if padding:
+                self.segments.append((offset, padding, b"\0" * padding))
+                offset += padding
+            fingerprint.update(f"{filename}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+        # End-of-archive marker: two empty blocks
+        end = b"\0" * (2 * tarfile.BLOCKSIZE)
+        self.segments.append((offset, len(end), end))
+        self.size = offset + len(end)
+        self.etag = fingerprint.hexdigest()
+
+    def iter_range(self, start=0, stop=None):
+        """Yield the archive bytes in [start, stop) chunk by chunk"""
+        stop = self.size if stop is None else stop
+        for offset, length, source in self.segments:
+            if offset + length <= start:
+                continue
+            if offset >= stop:
+                break
+            begin = max(start - offset, 0)
+            end = min(stop - offset, length)
+            if isinstance(source, bytes):
+                yield source[begin:end]
+                continue
+            with open(source, "rb") as file:
+                file.seek(begin)
+                remaining = end - begin
+                while remaining > 0:
+                    chunk = file.read(min(ARCHIVE_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise IOError(f"{source} changed while it was being archived")
+                    remaining -= len(chunk)
+                    yield chunk
+
+class _ChunkSink:
+    """Write-only file object collecting what zipfile writes so it can be yielded"""
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+def iter_zip(base_dir, filenames, root_name):
+    """
+    Yield a ZIP archive of the given files chunk by chunk.
+    Entries are stored without recompression (the audio is already
+    compressed), and memory use is one chunk regardless of archive size.
+    Unlike TarStream, the size is not known up front, so ranges are not supported.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for filename in filenames:
+            path = os.path.join(base_dir, filename)
+            info = zipfile.ZipInfo.from_file(path, f"{root_name}/{filename}")
+            info.compress_type = zipfile.ZIP_STORED
+            with open(path, "rb") as source, archive.open(info, "w", force_zip64=True) as entry:
+                while True:
+                    chunk = source.read(ARCHIVE_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    entry.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
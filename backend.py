@@ -1,5 +1,10 @@
 import yt_dlp
 import os
+import errno
+import shutil
+import tempfile
+import subprocess
+import contextlib
 import multiprocessing
 from concurrent.futures import ThreadPoolExecutor
 import spotipy
@@ -15,6 +20,9 @@ from mutagen.mp3 import MP3
 from mutagen.mp4 import MP4, MP4Cover
 from mutagen.flac import FLAC, Picture
 from io import BytesIO
+from library import open_index, track_key
+from cache import TrackCache
+from segmented import prefetch_stream
 
 # Constants for configuration
 SPOTIFY_SCOPE = "user-library-read"  # Scope for Spotify API access
@@ -23,10 +31,26 @@ SPOTIFY_TRACK_LIMIT = 50  # Limit for Spotify track retrieval
 YOUTUBE_RETRIES = 3  # Number of retries for YouTube search
 DOWNLOAD_RETRIES = 3  # Number of retries for downloading audio
 DOWNLOAD_BACKOFF = 2  # Backoff time for retries in seconds
+STAGING_DIR = os.environ.get("SPOTIFY_DL_STAGING_DIR")  # Scratch area for fetch/transcode/tagging (defaults to the system temp dir)
+MAX_CONCURRENT_WRITES = 2  # Max workers moving finished files into the library at once
+DOWNLOAD_SEGMENTS = 4  # Concurrent byte ranges/fragments per audio stream (1 disables segmented fetching)
+ALBUM_SEARCH_RESULTS = 5  # Full-album uploads considered per album in album mode
+ALBUM_DURATION_TOLERANCE = 0.02  # Max relative difference between an upload's length and the album's
+ALBUM_MIN_TOLERANCE = 10  # Seconds of length difference always tolerated, for short albums
+CHAPTER_TOLERANCE = 5  # Max seconds a chapter may differ from its track's length to be used as split points
+ALBUM_MODE_MIN_TRACKS = 3  # Albums missing fewer tracks than this are searched track by track
 
 # Global variable to track if we're exiting
 exiting = False
 
+# Per-worker settings, filled in by init_worker when a pool process starts
+_write_semaphore = None
+_staging_dir = STAGING_DIR
+_segments = DOWNLOAD_SEGMENTS
+
+# Optional callable telling a worker that its current job was cancelled
+_cancel_check = None
+
 def signal_handler():
     """
     Signal handler for graceful shutdown on interrupt signal.
@@ -46,12 +70,26 @@ with open("config.json") as file:
     client_secret = data['CLIENT_SECRET']
     redirect_uri = data['REDIRECT_URI']
 
+# Cache of resolved metadata and YouTube matches, shared with warmup runs
+track_cache = TrackCache()
+
+# Playlist listings whose new tracks are being downloaded, keyed by (playlist ID,
+# output directory); they only count as synced once confirm_playlist_sync is
+# called after a successful download
+_pending_syncs = {}
+
 # Initialize Spotify client with OAuth credentials
 sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
     client_id=client_id, client_secret=client_secret, 
     redirect_uri=redirect_uri, scope=SPOTIFY_SCOPE))
 
-def get_youtube_url(song_name, artist_name, retries=YOUTUBE_RETRIES):
+def get_youtube_url(song_name, artist_name, retries=YOUTUBE_RETRIES, track_id=None):
+    # Matches found earlier (e.g. by a warmup run) are reused
+    if track_id:
+        cached_url = track_cache.get_youtube_url(track_id)
+        if cached_url:
+            return cached_url
+    
     for attempt in range(retries):
         try:
             time.sleep(attempt)  # Exponential backoff
@@ -60,7 +98,10 @@ def get_youtube_url(song_name, artist_name, retries=YOUTUBE_RETRIES):
                 search_query = f"ytsearch1:{song_name} {artist_name}"
                 info = ydl.extract_info(search_query, download=False)
                 if 'entries' in info and len(info['entries']) > 0:
-                    return info['entries'][0]['webpage_url']
+                    youtube_url = info['entries'][0]['webpage_url']
+                    if track_id:
+                        track_cache.put_youtube_url(track_id, youtube_url)
+                    return youtube_url
                 else:
                     print(f"No YouTube results for: \"{song_name} {artist_name}\"")
                     return None
@@ -69,21 +110,23 @@ def get_youtube_url(song_name, artist_name, retries=YOUTUBE_RETRIES):
                 print(f"Error searching for \"{song_name} {artist_name}\": {str(e)}")
                 return None
 
-def get_songs_url(url, limit=None):
+def get_songs_url(url, limit=None, delta=True, output_dir=None):
     if "?" in url:
         # removes tracking, often spotify adds a share id in the url.
         url = url.split("?")[0]
     if "album" in url:
         return download_album(url)
     elif "playlist" in url:
-        return download_playlist(url, limit)
+        return download_playlist(url, limit, delta, output_dir)
     elif "spotify.com/user" in url:
         return download_user_library(limit)
     else:
         raise ValueError("Unknown URL format. Please use a Spotify album, playlist, or user library URL.")
 
-def download_playlist(url, limit=None):
-    return download_spotify_tracks(sp.playlist, sp.playlist_tracks, url, limit)
+def download_playlist(url, limit=None, delta=True, output_dir=None):
+    # Only the snapshot ID, name and size are needed up front; tracks are listed page by page
+    get_playlist = lambda id: sp.playlist(id, fields="snapshot_id,name,tracks.total")
+    return download_spotify_tracks(get_playlist, sp.playlist_tracks, url, limit, delta, output_dir)
 
 def download_album(url):
     return download_spotify_tracks(sp.album, lambda id, **kwargs: sp.album(id)['tracks'], url)
@@ -103,30 +146,117 @@ def download_user_library(limit=None):
     
     return process_tracks(tracks, "My Liked Songs", len(tracks), status="playlist")
 
-def download_spotify_tracks(get_func, get_tracks_func, url, limit=None):
+def download_spotify_tracks(get_func, get_tracks_func, url, limit=None, delta=False, output_dir=None):
     """
     get_func is a variable function to get the album or playlist
     get_tracks_func is a var function to get the tracks of the album or playlist
+    With delta=True (playlists, no limit), sync points are kept per output
+    directory (output_dir, or the playlist name by default): a playlist whose
+    snapshot ID is unchanged since the last confirmed sync into that
+    directory, and whose synced tracks are all still there, is not listed at
+    all; otherwise only tracks added since then, or missing from the
+    directory, are processed.
     """
     id = url.split("/")[-1] # for ex: https://open.spotify.com/playlist/6G1yylbkuV3dxeOYhdeguk here ID: 6G1yylbkuV3dxeOYhdeguk
     item = get_func(id)
     total_tracks = item['tracks']['total']
     tracks = []
     
+    snapshot_id = item.get('snapshot_id') if delta and not limit else None
+    library_dir = os.path.abspath(output_dir or item['name'])
+    index = open_index(library_dir) if snapshot_id else None
+    synced = index.get_synced(id) if index else None
+    if synced:
+        # Synced tracks whose files have gone missing are fetched again
+        present_ids = [track_id for track_id in synced['track_ids'] if index.is_complete(track_id)]
+        if synced['snapshot_id'] == snapshot_id and len(present_ids) == len(synced['track_ids']):
+            print(f"'{item['name']}' has not changed since the last sync")
+            return process_tracks([], item['name'], total_tracks, status="playlist")
+    
     for offset in range(0, total_tracks, 100):
         results = get_tracks_func(id, offset=offset, limit=100)
         tracks.extend(results['items'])
         if limit and len(tracks) >= limit:
             tracks = tracks[:limit]
             break
+    
+    if snapshot_id:
+        track_ids = [t['track']['id'] for t in tracks if t.get('track') and t['track'].get('id')]
+        added, removed, reordered = playlist_delta(present_ids if synced else [], track_ids)
+        if synced:
+            print(f"'{item['name']}' changed since the last sync: {len(added)} added, {len(removed)} removed"
+                  + (", reordered" if reordered else ""))
+            added_ids = set(added)
+            tracks = [t for t in tracks if t.get('track') and t['track'].get('id') in added_ids]
+        
+        # Tracks without a match or metadata keep the sync point where it is, so they are retried
+        urls, metadata_list, unresolved = resolve_tracks(tracks, total_tracks, status="playlist")
+        _pending_syncs[(id, library_dir)] = {'snapshot_id': snapshot_id, 'track_ids': track_ids, 'removed': removed,
+                              'unresolved': unresolved}
+        return urls, metadata_list, item['name']
+    
     if "album" in url:
         return process_tracks(tracks, item['name'], total_tracks, status="album")
     elif "playlist" in url:
         return process_tracks(tracks, item['name'], total_tracks, status="playlist")
 
+def playlist_delta(old_ids, new_ids):
+    """
+    Compare two ordered track-ID listings of a playlist.
+    
+    Returns:
+        (added IDs, removed IDs, whether the remaining tracks were reordered)
+    """
+    old_set, new_set = set(old_ids), set(new_ids)
+    added = [track_id for track_id in new_ids if track_id not in old_set]
+    removed = [track_id for track_id in old_ids if track_id not in new_set]
+    reordered = [i for i in new_ids if i in old_set] != [i for i in old_ids if i in new_set]
+    return added, removed, reordered
+
+def _pending_sync_key(url, output_dir):
+    return url.split("?")[0].rstrip("/").split("/")[-1], os.path.abspath(output_dir)
+
+def discard_playlist_sync(url, output_dir):
+    """
+    Drop a playlist listing that will not be confirmed (the download failed,
+    was cancelled or left tracks missing). Safe to call after confirming.
+    """
+    _pending_syncs.pop(_pending_sync_key(url, output_dir), None)
+
+def confirm_playlist_sync(url, output_dir, prune=False):
+    """
+    Record a playlist listing as synced into output_dir once its new tracks
+    have been downloaded there, so the next request for that directory only
+    fetches what changed after it. Nothing is recorded if any of the listed
+    tracks could not be resolved.
+    With prune=True, files of tracks removed from the playlist are deleted,
+    unless another playlist synced into the same directory still lists them.
+    
+    Returns:
+        Number of pruned files
+    """
+    id, library_dir = _pending_sync_key(url, output_dir)
+    pending = _pending_syncs.pop((id, library_dir), None)
+    if not pending:
+        return 0
+    if pending['unresolved']:
+        print(f"Not marking the playlist as synced: {pending['unresolved']} tracks could not be resolved "
+              "and will be retried next time")
+        return 0
+    index = open_index(output_dir)
+    index.put_synced(id, pending['snapshot_id'], pending['track_ids'])
+    
+    pruned = 0
+    if prune and pending['removed']:
+        still_used = index.tracks_in_other_playlists(id)
+        pruned = sum(index.remove(track_id) for track_id in pending['removed'] if track_id not in still_used)
+        print(f"Removed {pruned} songs that are no longer in the playlist from '{output_dir}'")
+    index.save()
+    return pruned
+
 # Structure to store track metadata
 class TrackMetadata:
-    def __init__(self, title, artist, album, year, track_number, genre, cover_url):
+    def __init__(self, title, artist, album, year, track_number, genre, cover_url, track_id=""):
         self.title = title
         self.artist = artist
         self.album = album
@@ -134,10 +264,19 @@ class TrackMetadata:
         self.track_number = track_number
         self.genre = genre
         self.cover_url = cover_url
+        self.track_id = track_id
 
 def get_track_metadata(track, status):
     """Extract metadata from a Spotify track"""
     try:
+        # Reuse metadata resolved earlier; only full track objects (with album info) are cached
+        track_obj = track if status == "album" else track['track']
+        cacheable = bool(track_obj.get('id')) and 'album' in track_obj
+        if cacheable:
+            cached = track_cache.get_metadata(track_obj['id'])
+            if cached:
+                return TrackMetadata(**cached)
+        
         if status == "album":
             title = track["name"]
             artist = track['artists'][0]['name']
@@ -149,6 +288,7 @@ def get_track_metadata(track, status):
             genres = ", ".join(artist_info['genres']) if 'genres' in artist_info and artist_info['genres'] else ""
             # Get cover art URL
             cover_url = track['album']['images'][0]['url'] if 'album' in track and 'images' in track['album'] and track['album']['images'] else ""
+            track_id = track.get('id') or ""
         else:  # playlist
             track_obj = track['track']
             title = track_obj["name"]
@@ -161,8 +301,12 @@ def get_track_metadata(track, status):
             genres = ", ".join(artist_info['genres']) if 'genres' in artist_info and artist_info['genres'] else ""
             # Get cover art URL
             cover_url = track_obj['album']['images'][0]['url'] if 'album' in track_obj and 'images' in track_obj['album'] and track_obj['album']['images'] else ""
+            track_id = track_obj.get('id') or ""
         
-        return TrackMetadata(title, artist, album, year, track_number, genres, cover_url)
+        metadata = TrackMetadata(title, artist, album, year, track_number, genres, cover_url, track_id)
+        if cacheable:
+            track_cache.put_metadata(track_id, vars(metadata))
+        return metadata
     except Exception as e:
         print(f"Error extracting metadata: {str(e)}")
         return None
@@ -271,11 +415,82 @@ def apply_metadata_to_file(filepath, metadata):
         print(f"Error applying metadata to {filepath}: {str(e)}")
         return False
 
+def init_worker(write_semaphore=None, staging_dir=None, segments=None):
+    """
+    Pool initializer for download workers.
+    Shares the library write budget, the staging location and the segment
+    count with each process.
+    """
+    global _write_semaphore, _staging_dir, _segments
+    _write_semaphore = write_semaphore
+    if staging_dir:
+        _staging_dir = staging_dir
+    if segments:
+        _segments = segments
+
+def set_cancel_check(check):
+    """Install a callable returning True when the current download should stop"""
+    global _cancel_check
+    _cancel_check = check
+
+def should_stop():
+    """Whether the current download should be abandoned (interrupt or cancellation)"""
+    return exiting or (_cancel_check is not None and _cancel_check())
+
+def _abort_if_stopping(progress):
+    """yt-dlp progress hook that aborts an in-flight transfer once it is cancelled"""
+    if should_stop():
+        raise yt_dlp.utils.DownloadCancelled("Download cancelled")
+
+def write_budget():
+    """Context manager limiting how many workers write into the library at once"""
+    if _write_semaphore is None:
+        return contextlib.nullcontext()
+    return _write_semaphore
+
+def commit_staged_file(staged_path, output_dir, filename=None):
+    """
+    Move a finished file from the staging area into the library as `filename`
+    (defaults to the staged file's own name).
+    The final name only appears once the file is complete: a same-filesystem
+    move is a single rename, otherwise the file is copied next to its target
+    under a hidden name and renamed into place.
+    """
+    filename = filename or os.path.basename(staged_path)
+    final_path = os.path.join(output_dir, filename)
+    with write_budget():
+        try:
+            os.replace(staged_path, final_path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            partial_path = os.path.join(output_dir, f".{filename}.part")
+            try:
+                shutil.copyfile(staged_path, partial_path)
+                os.replace(partial_path, final_path)
+            finally:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+            os.remove(staged_path)
+    return final_path
+
 def process_tracks(tracks, name, total_tracks, status):
+    url_list, metadata_list, _ = resolve_tracks(tracks, total_tracks, status)
+    return url_list, metadata_list, name
+
+def resolve_tracks(tracks, total_tracks, status):
+    """
+    Look up metadata and a YouTube match for each track.
+    
+    Returns:
+        (url_list, metadata_list, number of unresolved tracks), where a track
+        is unresolved if no YouTube match was found or its metadata lookup failed
+    """
     print(f"Processing {len(tracks)} out of {total_tracks} tracks")
     url_list = []
     metadata_list = []
     not_found = []
+    no_metadata = 0
     
     # Extract metadata for all tracks
     metadata_map = {}
@@ -293,9 +508,9 @@ def process_tracks(tracks, name, total_tracks, status):
     
     with ThreadPoolExecutor(max_workers=10) as executor:
         if status == "album":
-            futures = [executor.submit(get_youtube_url, song["name"], song['artists'][0]['name']) for song in tracks]
+            futures = [executor.submit(get_youtube_url, song["name"], song['artists'][0]['name'], track_id=song.get('id')) for song in tracks]
         elif status == "playlist":
-            futures = [executor.submit(get_youtube_url, song['track']["name"], song['track']['artists'][0]['name']) for song in tracks]
+            futures = [executor.submit(get_youtube_url, song['track']["name"], song['track']['artists'][0]['name'], track_id=song['track'].get('id')) for song in tracks]
         
         for i, future in enumerate(futures):
             result = future.result()
@@ -312,21 +527,77 @@ def process_tracks(tracks, name, total_tracks, status):
                 
                 url_list.append(result)
                 metadata_list.append(metadata)
+                if metadata is None:
+                    no_metadata += 1
             else:
                 not_found.append(future)
     
+    track_cache.save()
+    
     print(f"Found YouTube URLs for {len(url_list)} out of {len(tracks)} tracks")
     if not_found:
         print(f"Could not find YouTube URLs for {len(not_found)} tracks")
     
-    return url_list, metadata_list, name
+    return url_list, metadata_list, len(not_found) + no_metadata
 
-def download_youtube_audio(args):
-    url, output_dir, audio_format, audio_quality, metadata = args
-    global exiting
-    if exiting:
-        return False
+def prepare_downloads(urls, metadata_list, output_dir, audio_format, audio_quality):
+    """
+    Build the worker argument tuples for a set of tracks.
+    Target filenames are reserved in the output directory's index up front,
+    and tracks that are already in the library are skipped.
+    
+    Returns:
+        (args_list, skipped_count)
+    """
+    index = open_index(output_dir)
+    args_list = []
+    skipped = 0
+    for url, metadata in zip(urls, metadata_list):
+        key = track_key(url, metadata)
+        if index.is_complete(key):
+            skipped += 1
+            continue
+        filename = index.assign(key, metadata, audio_format, fallback_name=url.split("v=")[-1])
+        args_list.append((url, output_dir, audio_format, audio_quality, metadata, filename))
+    index.save()
+    return args_list, skipped
+
+def make_staging_root(staging_dir=None):
+    """
+    Create a private staging directory for a whole run, to hand to its workers.
+    Workers killed by pool.terminate() never run their own cleanup, so the
+    owner of the pool removes the whole root once the pool has exited.
+    
+    Args:
+        staging_dir: Scratch area to create the root in (defaults to STAGING_DIR or the system temp dir)
+    """
+    base_dir = staging_dir or STAGING_DIR
+    if base_dir:
+        os.makedirs(base_dir, exist_ok=True)
+    return tempfile.mkdtemp(prefix="spotify-dl-run-", dir=base_dir)
 
+@contextlib.contextmanager
+def staging_root(staging_dir=None):
+    """Context manager around make_staging_root that removes the root on exit"""
+    root = make_staging_root(staging_dir)
+    try:
+        yield root
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def make_staging_dir():
+    """Create a private scratch directory for one download in the staging area"""
+    if _staging_dir:
+        os.makedirs(_staging_dir, exist_ok=True)
+    return tempfile.mkdtemp(prefix="spotify-dl-", dir=_staging_dir)
+
+def fetch_audio(url, staging_dir, audio_format, audio_quality):
+    """
+    Fetch a YouTube video's audio into a staging directory and transcode it.
+    
+    Returns:
+        (path of the transcoded file, yt-dlp info dict of the video)
+    """
     ydl_opts = {
         'format': 'bestaudio/best',
         'postprocessors': [{
@@ -334,43 +605,236 @@ def download_youtube_audio(args):
             'preferredcodec': audio_format,
             'preferredquality': audio_quality,
         }],
-        'outtmpl': os.path.join(output_dir, '%(title)s.%(ext)s'),
+        'outtmpl': os.path.join(staging_dir, '%(id)s.%(ext)s'),
+        'progress_hooks': [_abort_if_stopping],
+        'concurrent_fragment_downloads': _segments,  # DASH/HLS fragments fetched in parallel
         'quiet': True,
         'no_warnings': True,
     }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        if _segments > 1:
+            # Large plain HTTP streams are fetched as parallel byte ranges;
+            # yt-dlp then finds the file in place and only transcodes it
+            info_dict = ydl.extract_info(url, download=False)
+            prefetch_stream(ydl, info_dict, _segments, should_stop)
+            ydl.process_info(info_dict)
+        else:
+            info_dict = ydl.extract_info(url, download=True)
+        downloaded_file = ydl.prepare_filename(info_dict)
+    # Get actual downloaded filename with extension
+    return os.path.splitext(downloaded_file)[0] + "." + audio_format, info_dict
+
+def download_youtube_audio(args):
+    url, output_dir, audio_format, audio_quality, metadata, filename = args
+    if should_stop():
+        return False
+
+    # Fetch, transcode and tag in a private staging directory so that
+    # interrupted downloads never leave partial files in the library
+    staging_dir = make_staging_dir()
+
+    try:
+        for attempt in range(DOWNLOAD_RETRIES):
+            if should_stop():
+                return False
+            try:
+                file_path, _ = fetch_audio(url, staging_dir, audio_format, audio_quality)
 
-    for attempt in range(DOWNLOAD_RETRIES):
-        if exiting:
-            return False
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info_dict = ydl.extract_info(url, download=True)
-                downloaded_file = ydl.prepare_filename(info_dict)
-                # Get actual downloaded filename with extension
-                file_path = os.path.splitext(downloaded_file)[0] + "." + audio_format
-                
                 # Apply metadata if available
                 if metadata and os.path.exists(file_path):
                     apply_metadata_to_file(file_path, metadata)
-                
-            return True
-        except Exception as e:
-            if attempt == DOWNLOAD_RETRIES - 1:
-                print(f"Error downloading {url}: {str(e)}")
-                return False
-            time.sleep(attempt * DOWNLOAD_BACKOFF)
 
-def download_multiple(urls, metadata_list, output_dir, num_processes=5, audio_format='mp3', audio_quality='192'):
+                commit_staged_file(file_path, output_dir, filename)
+                return True
+            except Exception as e:
+                if should_stop():
+                    return False
+                if attempt == DOWNLOAD_RETRIES - 1:
+                    print(f"Error downloading {url}: {str(e)}")
+                    # The cached match may be gone or blocked; search for the track again next time
+                    if metadata and metadata.track_id:
+                        track_cache.mark_youtube_url_failed(metadata.track_id, url)
+                        track_cache.save()
+                    return False
+                time.sleep(attempt * DOWNLOAD_BACKOFF)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+def album_tracks(id):
+    """
+    Get an album and all of its tracks, following the track pages past the first.
+    Album tracks are simplified objects without album info, so the album's
+    name, release date and images are attached to each of them.
+    
+    Returns:
+        (album, tracks)
+    """
+    album = sp.album(id)
+    tracks = list(album['tracks']['items'])
+    while len(tracks) < album['tracks']['total']:
+        results = sp.album_tracks(id, limit=SPOTIFY_TRACK_LIMIT, offset=len(tracks))
+        if not results['items']:
+            break
+        tracks.extend(results['items'])
+    album_info = {key: album[key] for key in ('name', 'release_date', 'images') if key in album}
+    return album, [dict(track, album=album_info) for track in tracks]
+
+def find_album_upload(album_name, artist_name, expected_seconds):
+    """
+    Search YouTube for a single upload of a whole album.
+    Only uploads whose length is within ALBUM_DURATION_TOLERANCE (at least
+    ALBUM_MIN_TOLERANCE seconds) of the album's total length are accepted.
+    
+    Returns:
+        URL of the closest match, or None
+    """
+    tolerance = max(ALBUM_MIN_TOLERANCE, expected_seconds * ALBUM_DURATION_TOLERANCE)
+    search_query = f"ytsearch{ALBUM_SEARCH_RESULTS}:{artist_name} {album_name} full album"
+    try:
+        # Flat extraction lists the results with their lengths without resolving each video
+        with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True, 'extract_flat': 'in_playlist'}) as ydl:
+            info = ydl.extract_info(search_query, download=False)
+    except Exception as e:
+        print(f"Error searching for \"{artist_name} {album_name}\": {str(e)}")
+        return None
+    
+    best_url, best_difference = None, None
+    for entry in info.get('entries') or []:
+        duration = entry.get('duration')
+        url = entry.get('webpage_url') or entry.get('url')
+        if not duration or not url:
+            continue
+        difference = abs(duration - expected_seconds)
+        if difference <= tolerance and (best_difference is None or difference < best_difference):
+            best_url, best_difference = url, difference
+    return best_url
+
+def split_points(durations, total_duration, chapters=None):
+    """
+    Work out where each track starts and ends in a full-album upload.
+    The upload's chapters are used if there is one per track and each is
+    within CHAPTER_TOLERANCE of its track's length; otherwise the track
+    lengths are laid end to end, stretched to the upload's actual length.
+    
+    Args:
+        durations: Length of each track in seconds, in album order
+        total_duration: Length of the upload in seconds (None if unknown)
+        chapters: yt-dlp chapter list of the upload
+    
+    Returns:
+        List of (start, end) times in seconds, one per track
+    """
+    if chapters and len(chapters) == len(durations) and all(
+            abs((chapter['end_time'] - chapter['start_time']) - duration) <= CHAPTER_TOLERANCE
+            for chapter, duration in zip(chapters, durations)):
+        return [(chapter['start_time'], chapter['end_time']) for chapter in chapters]
+    
+    scale = total_duration / sum(durations) if total_duration else 1
+    points = []
+    start = 0.0
+    for duration in durations:
+        points.append((start, start + duration * scale))
+        start += duration * scale
+    return points
+
+def split_audio(source_path, start, end, dest_path):
+    """Cut [start, end) seconds out of an audio file without re-encoding it"""
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-ss", f"{start:.3f}", "-i", source_path, "-t", f"{end - start:.3f}",
+         "-map", "0:a", "-map_metadata", "-1", "-c", "copy", dest_path],
+        check=True, capture_output=True)
+
+def download_album_whole(url, audio_format='mp3', audio_quality='192', output_dir=None):
+    """
+    Album mode: download one full-album upload and split it into tagged tracks
+    with ffmpeg, instead of searching for and downloading every track on its own.
+    Tracks already in the library are left alone. If no upload matches the
+    album's length, or a track cannot be cut out of it, those tracks go back
+    to the usual per-track search.
+    
+    Args:
+        url: Spotify album URL
+        audio_format: Format of the saved tracks
+        audio_quality: Bitrate passed to the transcoder
+        output_dir: Library directory (defaults to the album name)
+    
+    Returns:
+        (number of tracks saved, (urls, metadata_list, output_dir) of the tracks left to download)
+    """
+    id = url.split("?")[0].rstrip("/").split("/")[-1]
+    album, tracks = album_tracks(id)
+    output_dir = output_dir or album['name']
+    metadata_list = [get_track_metadata(track, "album") for track in tracks]
+    
+    index = open_index(output_dir)
+    missing = [i for i, metadata in enumerate(metadata_list)
+               if not (metadata and metadata.track_id and index.is_complete(metadata.track_id))]
+    
+    def fall_back(remaining):
+        urls, remaining_metadata, _ = process_tracks([tracks[i] for i in remaining], album['name'], len(tracks), status="album")
+        return urls, remaining_metadata, output_dir
+    
+    if len(missing) < ALBUM_MODE_MIN_TRACKS:
+        return 0, fall_back(missing)
+    
+    expected_seconds = sum(track['duration_ms'] for track in tracks) / 1000
+    video_url = find_album_upload(album['name'], album['artists'][0]['name'], expected_seconds)
+    if not video_url:
+        print(f"No full-album upload matches the length of '{album['name']}'; searching track by track")
+        return 0, fall_back(missing)
+    
+    print(f"Splitting {len(missing)} tracks out of {video_url}")
+    os.makedirs(output_dir, exist_ok=True)
+    staging_dir = make_staging_dir()
+    saved = set()
+    try:
+        source_path, info_dict = fetch_audio(video_url, staging_dir, audio_format, audio_quality)
+        points = split_points([track['duration_ms'] / 1000 for track in tracks],
+                              info_dict.get('duration'), info_dict.get('chapters'))
+        for i in missing:
+            metadata = metadata_list[i]
+            if should_stop():
+                break
+            if not (metadata and metadata.track_id):
+                continue
+            start, end = points[i]
+            track_path = os.path.join(staging_dir, f"track-{i:03d}.{audio_format}")
+            try:
+                split_audio(source_path, start, end, track_path)
+                apply_metadata_to_file(track_path, metadata)
+                filename = index.assign(metadata.track_id, metadata, audio_format)
+                commit_staged_file(track_path, output_dir, filename)
+                saved.add(i)
+            except (OSError, subprocess.CalledProcessError) as e:
+                print(f"Error splitting '{metadata.title}' out of {video_url}: {str(e)}")
+    except Exception as e:
+        if not should_stop():
+            print(f"Error downloading {video_url}: {str(e)}")
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        index.save()
+    
+    print(f"Saved {len(saved)} out of {len(missing)} tracks from the full-album upload")
+    if should_stop():
+        return len(saved), ([], [], output_dir)
+    return len(saved), fall_back([i for i in missing if i not in saved])
+
+def download_multiple(urls, metadata_list, output_dir, num_processes=5, audio_format='mp3', audio_quality='192',
+                      staging_dir=None, max_writes=MAX_CONCURRENT_WRITES, segments=DOWNLOAD_SEGMENTS):
     global exiting
     os.makedirs(output_dir, exist_ok=True)
+    write_semaphore = multiprocessing.Semaphore(max_writes)
+    
+    args_list, skipped = prepare_downloads(urls, metadata_list, output_dir, audio_format, audio_quality)
+    if skipped:
+        print(f"Skipping {skipped} songs already in '{output_dir}'")
     
-    with multiprocessing.Pool(processes=num_processes) as pool:
-        args_list = [
-            (url, output_dir, audio_format, audio_quality, metadata) 
-            for url, metadata in zip(urls, metadata_list)
-        ]
+    # The pool exits (or is terminated) before the staging root is removed
+    with staging_root(staging_dir) as run_staging_dir, \
+            multiprocessing.Pool(processes=num_processes, initializer=init_worker,
+                                 initargs=(write_semaphore, run_staging_dir, segments)) as pool:
         results = []
-        pbar = tqdm(total=len(urls), desc="Downloading")
+        pbar = tqdm(total=len(args_list), desc="Downloading")
         for result in pool.imap(download_youtube_audio, args_list):
             results.append(result)
             pbar.update(1)
@@ -380,9 +844,10 @@ def download_multiple(urls, metadata_list, output_dir, num_processes=5, audio_fo
         pbar.close()
     
     success_count = sum(results)
-    print(f"\nSuccessfully downloaded {success_count} out of {len(urls)} songs.")
+    print(f"\nSuccessfully downloaded {success_count} out of {len(args_list)} songs.")
     if exiting:
         print("Download process was interrupted. Some songs may not have been downloaded.")
+    return success_count + skipped
 
 if __name__ == "__main__":
     # adding arguments for better cli usablity
@@ -391,22 +856,38 @@ if __name__ == "__main__":
     parser.add_argument("-l", "--limit", type=int, help="Limit number of songs to download")
     parser.add_argument("-f", "--format", default="mp3", choices=["mp3", "m4a", "wav"], help="Audio format")
     parser.add_argument("-q", "--quality", default="192", choices=["128", "192", "256", "320"], help="Audio quality (bitrate)")
+    parser.add_argument("--staging-dir", default=STAGING_DIR, help="Scratch directory (e.g. a tmpfs) used while fetching, transcoding and tagging")
+    parser.add_argument("--max-writes", type=int, default=MAX_CONCURRENT_WRITES, help="Max number of files moved into the output directory at once")
+    parser.add_argument("--full", action="store_true", help="Process every playlist track, even if the playlist was synced before")
+    parser.add_argument("--prune", action="store_true", help="Delete songs that were removed from the playlist since the last sync")
+    parser.add_argument("--segments", type=int, default=DOWNLOAD_SEGMENTS, help="Parallel byte ranges/fragments per audio stream (1 to disable)")
+    parser.add_argument("--album-mode", action="store_true", help="For albums, split one full-album upload into tracks instead of searching for each track (--limit is ignored)")
     args = parser.parse_args()
 
     try:
+        album_saved = 0
         if args.url.lower() == 'liked': # liked songs
             urls, metadata_list, output_dir = download_user_library(args.limit)
+        elif args.album_mode and "album" in args.url:
+            with staging_root(args.staging_dir) as run_staging_dir:
+                init_worker(staging_dir=run_staging_dir, segments=args.segments)
+                album_saved, (urls, metadata_list, output_dir) = download_album_whole(args.url, args.format, args.quality)
         else:
-            urls, metadata_list, output_dir = get_songs_url(args.url, args.limit)
+            urls, metadata_list, output_dir = get_songs_url(args.url, args.limit, delta=not args.full)
 
         num_processes = min(multiprocessing.cpu_count(), 5)
         
         print(f"Attempting to download {len(urls)} songs to '{output_dir}'...")
-        download_multiple(urls, metadata_list, output_dir, num_processes, args.format, args.quality)
+        available = album_saved + download_multiple(urls, metadata_list, output_dir, num_processes, args.format,
+                                                    args.quality, args.staging_dir, args.max_writes, args.segments)
+        total = album_saved + len(urls)
         
         if not exiting:
             print("All downloads completed.")
-            print(f"Successfully downloaded {len([f for f in os.listdir(output_dir) if f.endswith('.' + args.format)])} songs.")
+            print(f"{available} out of {total} songs are now in '{output_dir}'.")
+            # Only a fully successful run moves the playlist's sync point forward
+            if available == total:
+                confirm_playlist_sync(args.url, output_dir, prune=args.prune)
 
     except KeyboardInterrupt:
         print("\nScript interrupted by user. Exiting...")
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import threading
+
+# Constants for configuration
+CACHE_PATH = os.environ.get("SPOTIFY_DL_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "spotify-dl", "cache.json"))
+RELOAD_INTERVAL = 5  # Seconds between checks for changes written by other processes
+
+class TrackCache:
+    """
+    Persistent cache of resolved track data, keyed by Spotify track ID.
+    Holds each track's metadata and YouTube match, plus the last seen
+    snapshot ID of every watched playlist.
+
+    Several processes (the CLI, the web app, warmup runs) can share one cache
+    file: changes made elsewhere are picked up on the next lookup and saves
+    merge with what is on disk.
+
+    A YouTube match whose download failed is marked as failed rather than
+    deleted (a deletion would be undone by the next merge), and is no longer
+    returned, so the track is searched for again.
+    """
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.lock = threading.RLock()
+        self.tracks = {}     # track_id -> {'metadata': {...}, 'youtube_url': ..., 'failed_youtube_url': ...}
+        self.snapshots = {}  # playlist_id -> snapshot_id seen by the last warmup
+        self.dirty = False
+        self.loaded_mtime = None
+        self.last_reload_check = 0
+        self._load()
+
+    def _read(self):
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable cache {self.path}: {str(e)}")
+            return {}
+
+    def _load(self):
+        data = self._read()
+        self.tracks = data.get("tracks", {})
+        self.snapshots = data.get("snapshots", {})
+        self.loaded_mtime = self._mtime()
+
+    def _mtime(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def _refresh(self):
+        # Pick up entries written by other processes, without dropping unsaved ones
+        now = time.time()
+        if now - self.last_reload_check < RELOAD_INTERVAL:
+            return
+        self.last_reload_check = now
+        if self._mtime() == self.loaded_mtime:
+            return
+        data = self._read()
+        for track_id, entry in data.get("tracks", {}).items():
+            self.tracks[track_id] = {**entry, **self.tracks.get(track_id, {})}
+        self.snapshots = {**data.get("snapshots", {}), **self.snapshots}
+        self.loaded_mtime = self._mtime()
+
+    def get_metadata(self, track_id):
+        with self.lock:
+            self._refresh()
+            return self.tracks.get(track_id, {}).get("metadata")
+
+    def put_metadata(self, track_id, metadata):
+        with self.lock:
+            self.tracks.setdefault(track_id, {})["metadata"] = metadata
+            self.dirty = True
+
+    def _usable_youtube_url(self, entry):
+        youtube_url = entry.get("youtube_url")
+        if youtube_url and youtube_url != entry.get("failed_youtube_url"):
+            return youtube_url
+        return None
+
+    def get_youtube_url(self, track_id):
+        with self.lock:
+            self._refresh()
+            return self._usable_youtube_url(self.tracks.get(track_id, {}))
+
+    def put_youtube_url(self, track_id, youtube_url):
+        with self.lock:
+            entry = self.tracks.setdefault(track_id, {})
+            entry["youtube_url"] = youtube_url
+            if entry.get("failed_youtube_url") == youtube_url:
+                # Found again by a new search; give it another chance
+                entry["failed_youtube_url"] = None
+            self.dirty = True
+
+    def mark_youtube_url_failed(self, track_id, youtube_url):
+        """Stop using a cached YouTube match whose download failed (e.g. the video was taken down)"""
+        with self.lock:
+            self.tracks.setdefault(track_id, {})["failed_youtube_url"] = youtube_url
+            self.dirty = True
+
+    def is_warm(self, track_id):
+        """Whether both the metadata and a usable YouTube match of a track are cached"""
+        with self.lock:
+            self._refresh()
+            entry = self.tracks.get(track_id, {})
+            return "metadata" in entry and self._usable_youtube_url(entry) is not None
+
+    def failed_track_ids(self):
+        """IDs of tracks whose cached YouTube match is marked as failed and not yet replaced"""
+        with self.lock:
+            self._refresh()
+            return {
+                track_id for track_id, entry in self.tracks.items()
+                if entry.get("youtube_url") and entry.get("youtube_url") == entry.get("failed_youtube_url")
+            }
+
+    def get_snapshot(self, playlist_id):
+        with self.lock:
+            self._refresh()
+            return self.snapshots.get(playlist_id)
+
+    def put_snapshot(self, playlist_id, snapshot_id):
+        with self.lock:
+            self.snapshots[playlist_id] = snapshot_id
+            self.dirty = True
+
+    def save(self):
+        """Merge with the file on disk and write it back atomically"""
+        with self.lock:
+            if not self.dirty:
+                return
+            data = self._read()
+            tracks = data.get("tracks", {})
+            for track_id, entry in self.tracks.items():
+                tracks[track_id] = {**tracks.get(track_id, {}), **entry}
+            snapshots = {**data.get("snapshots", {}), **self.snapshots}
+
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as file:
+                json.dump({"tracks": tracks, "snapshots": snapshots}, file)
+            os.replace(tmp_path, self.path)
+
+            self.tracks = tracks
+            self.snapshots = snapshots
+            self.loaded_mtime = self._mtime()
+            self.dirty = False
@@ -1,90 +1,255 @@
-import os
 import time
+import heapq
+import shutil
+import atexit
+import itertools
 import threading
-from backend import download_youtube_audio
+from backend import download_youtube_audio, init_worker, set_cancel_check, make_staging_root, MAX_CONCURRENT_WRITES
 import multiprocessing
 
-# This is a global variable accessible to the main process only
-# It won't be shared with worker processes
-_progress_callbacks = {}
+# Constants for configuration
+EARLY_CANCEL_TTL = 3600  # Seconds a cancellation is remembered for a task that has not been queued yet
 
-def download_with_progress(args):
+# Task IDs cancelled in the scheduler, shared with its worker processes
+_cancelled_tasks = None
+
+def init_scheduler_worker(write_semaphore, staging_dir, cancelled_tasks):
     """
-    Simple wrapper for download_youtube_audio that can be used with multiprocessing.
+    Pool initializer for DownloadScheduler workers.
     
     Args:
-        args: A tuple containing (url, output_dir, audio_format, audio_quality, metadata)
-              These arguments are passed to download_youtube_audio
-              
-    Returns:
-        Boolean indicating whether the download was successful
+        write_semaphore: Shared budget for writes into output directories
+        staging_dir: Scratch directory for fetch/transcode/tagging (optional)
+        cancelled_tasks: Manager dict whose keys are the cancelled task IDs
     """
-    return download_youtube_audio(args)
+    global _cancelled_tasks
+    init_worker(write_semaphore, staging_dir)
+    _cancelled_tasks = cancelled_tasks
 
-def download_with_tracking(task_id, urls, metadata_list, output_dir, num_processes, audio_format, audio_quality, callback):
+def run_scheduled_job(job):
     """
-    Download multiple songs with progress tracking.
-    Manages a pool of worker processes and updates progress.
+    Run one scheduled download inside a worker process.
     
     Args:
-        task_id: ID of the task for identification
-        urls: List of YouTube URLs to download
-        metadata_list: List of metadata objects corresponding to URLs
-        output_dir: Directory to save downloaded files
-        num_processes: Number of simultaneous download processes to use
-        audio_format: Audio format (mp3, m4a, wav)
-        audio_quality: Audio quality (128, 192, 256, 320)
-        callback: Function to call after each download completes
+        job: A tuple containing (task_id, args) where args is passed to download_youtube_audio
         
     Returns:
-        Number of successfully downloaded songs
+        Boolean indicating whether the download was successful
     """
-    # Create output directory if it doesn't exist
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # Prepare arguments list for each download
-    args_list = [
-        (url, output_dir, audio_format, audio_quality, metadata) 
-        for url, metadata in zip(urls, metadata_list)
-    ]
-    
-    # Store results as they complete
-    results = []
+    task_id, args = job
+    set_cancel_check(lambda: task_id in _cancelled_tasks)
+    try:
+        return download_youtube_audio(args)
+    finally:
+        set_cancel_check(None)
+
+class EarlyCancellations:
+    """
+    Task IDs cancelled before their jobs were queued, so that a later run()
+    returns straight away. A task cancelled while it is still preparing
+    usually never calls run() at all, so entries expire after
+    EARLY_CANCEL_TTL instead of accumulating. Callers hold the scheduler's lock.
+    """
+    def __init__(self, ttl=EARLY_CANCEL_TTL):
+        self.ttl = ttl
+        self.cancelled_at = {}  # task_id -> time of the cancellation
+
+    def add(self, task_id):
+        now = time.time()
+        self.cancelled_at = {
+            cancelled_id: cancelled_at for cancelled_id, cancelled_at in self.cancelled_at.items()
+            if now - cancelled_at < self.ttl
+        }
+        self.cancelled_at[task_id] = now
+
+    def pop(self, task_id):
+        """Whether a task was cancelled before it was queued, forgetting it either way"""
+        return self.cancelled_at.pop(task_id, None) is not None
+
+    def __len__(self):
+        return len(self.cancelled_at)
+
+class ScheduledTask:
+    """
+    Scheduler-side state of one task: its queued jobs and completion tracking.
+    """
+    def __init__(self, task_id, priority, total, callback):
+        self.id = task_id
+        self.priority = priority      # Lower values are dispatched first
+        self.remaining = total        # Jobs not yet finished or dropped
+        self.succeeded = 0            # Jobs that finished successfully
+        self.callback = callback      # Called after each finished job
+        self.paused = False           # Paused tasks keep their queued jobs on hold
+        self.cancelled = False
+        self.held = []                # Queue entries set aside while paused
+        self.done = threading.Event()
+
+class DownloadScheduler:
+    """
+    Shared download pool for all tasks of the web service.
     
-    # Start a process pool for parallel downloads
-    with multiprocessing.Pool(processes=num_processes) as pool:
-        # Track how many downloads have completed
-        completed = 0
-        total = len(args_list)
+    Jobs from every task go through a single priority queue, and only as many
+    jobs as there are worker processes are handed to the pool at a time, so a
+    small interactive request overtakes a large queued batch at the next free
+    slot. Tasks can be paused (queued jobs are held back, in-flight ones
+    finish) and cancelled (queued jobs are dropped and in-flight transfers
+    are aborted from their yt-dlp progress hook).
+    """
+    def __init__(self, num_processes, staging_dir=None, max_writes=MAX_CONCURRENT_WRITES):
+        self.num_processes = num_processes
+        self.condition = threading.Condition()
+        self.queue = []                    # Heap of (priority, sequence, task_id, args)
+        self.sequence = itertools.count()  # Keeps FIFO order within a priority
+        self.tasks = {}                    # task_id -> ScheduledTask
+        self.cancelled_early = EarlyCancellations()  # Tasks cancelled before their jobs were queued
+        self.in_flight = 0
         
-        # This function runs in a separate thread to monitor progress
-        def progress_monitor():
-            nonlocal completed
-            while completed < total:
-                # Sleep to reduce CPU usage
-                time.sleep(0.5)
-                
-                # Check if we have new results
-                current = len(results)
-                if current > completed:
-                    # Update progress for each newly completed download
-                    for _ in range(current - completed):
-                        if callback:
-                            callback()
-                    completed = current
+        # Private staging root for this scheduler's workers; terminated workers leave
+        # their scratch files behind, so the whole root is removed when the pool goes
+        self.staging_root = make_staging_root(staging_dir)
         
-        # Start the monitor thread
-        monitor = threading.Thread(target=progress_monitor)
-        monitor.daemon = True  # Thread will exit when main thread exits
-        monitor.start()
+        self.manager = multiprocessing.Manager()
+        self.cancelled = self.manager.dict()
+        self.pool = multiprocessing.Pool(
+            processes=num_processes, initializer=init_scheduler_worker,
+            initargs=(multiprocessing.Semaphore(max_writes), self.staging_root, self.cancelled)
+        )
+        atexit.register(self.close)
         
-        # Start the downloads using imap_unordered for better performance
-        # This returns results as they complete rather than in order
-        for result in pool.imap_unordered(download_with_progress, args_list):
-            results.append(result)
+        dispatcher = threading.Thread(target=self._dispatch_loop)
+        dispatcher.daemon = True
+        dispatcher.start()
+
+    def run(self, task_id, args_list, priority, callback=None):
+        """
+        Queue a task's downloads and wait until they have all finished or been cancelled.
         
-        # Wait for the monitor to catch up with any final results
-        monitor.join(timeout=1.0)
-    
-    # Return the number of successful downloads
-    return sum(results)
+        Args:
+            task_id: ID of the task the jobs belong to
+            args_list: Argument tuples for download_youtube_audio
+            priority: Scheduling priority, lower values run first
+            callback: Function to call after each download completes
+            
+        Returns:
+            Number of successfully downloaded songs
+        """
+        task = ScheduledTask(task_id, priority, len(args_list), callback)
+        with self.condition:
+            if self.cancelled_early.pop(task_id):
+                return 0
+            self.tasks[task_id] = task
+            for args in args_list:
+                heapq.heappush(self.queue, (priority, next(self.sequence), task_id, args))
+            if not args_list:
+                self._finish(task)
+            self.condition.notify_all()
+        task.done.wait()
+        return task.succeeded
+
+    def cancel(self, task_id):
+        """
+        Drop a task's queued jobs and abort its in-flight downloads.
+        Cancelling a task that has not been queued yet makes its later run() return straight away.
+        """
+        with self.condition:
+            task = self.tasks.get(task_id)
+            if not task:
+                self.cancelled_early.add(task_id)
+                return True
+            if task.cancelled:
+                return False
+            task.cancelled = True
+            self.cancelled[task_id] = True
+            
+            kept = [entry for entry in self.queue if entry[2] != task_id]
+            dropped = len(self.queue) - len(kept) + len(task.held)
+            self.queue = kept
+            heapq.heapify(self.queue)
+            task.held = []
+            
+            task.remaining -= dropped
+            if task.remaining <= 0:
+                self._finish(task)
+            self.condition.notify_all()
+            return True
+
+    def pause(self, task_id):
+        """Hold back a task's queued jobs; downloads already running are allowed to finish"""
+        with self.condition:
+            task = self.tasks.get(task_id)
+            if not task or task.cancelled:
+                return False
+            task.paused = True
+            return True
+
+    def resume(self, task_id):
+        """Put a paused task's held jobs back in the queue"""
+        with self.condition:
+            task = self.tasks.get(task_id)
+            if not task or task.cancelled:
+                return False
+            task.paused = False
+            for entry in task.held:
+                heapq.heappush(self.queue, entry)
+            task.held = []
+            self.condition.notify_all()
+            return True
+
+    def close(self):
+        """Stop the worker pool and remove everything left in the staging root"""
+        self.pool.terminate()
+        self.pool.join()
+        shutil.rmtree(self.staging_root, ignore_errors=True)
+
+    def _next_job(self):
+        # Pop the most urgent runnable entry, setting aside jobs of paused tasks
+        while self.queue:
+            entry = heapq.heappop(self.queue)
+            task = self.tasks.get(entry[2])
+            if task is None or task.cancelled:
+                continue
+            if task.paused:
+                task.held.append(entry)
+                continue
+            return entry
+        return None
+
+    def _dispatch_loop(self):
+        while True:
+            with self.condition:
+                entry = None
+                while entry is None:
+                    if self.in_flight < self.num_processes:
+                        entry = self._next_job()
+                    if entry is None:
+                        self.condition.wait()
+                self.in_flight += 1
+            
+            _, _, task_id, args = entry
+            self.pool.apply_async(
+                run_scheduled_job, ((task_id, args),),
+                callback=lambda result, task_id=task_id: self._job_finished(task_id, result),
+                error_callback=lambda error, task_id=task_id: self._job_finished(task_id, False)
+            )
+
+    def _job_finished(self, task_id, result):
+        # Runs in the pool's result handler thread
+        with self.condition:
+            task = self.tasks.get(task_id)
+        if task and task.callback:
+            task.callback()
+        with self.condition:
+            self.in_flight -= 1
+            if task:
+                task.remaining -= 1
+                if result:
+                    task.succeeded += 1
+                if task.remaining <= 0:
+                    self._finish(task)
+            self.condition.notify_all()
+
+    def _finish(self, task):
+        # Caller holds self.condition
+        self.tasks.pop(task.id, None)
+        self.cancelled.pop(task.id, None)
+        task.done.set()
@@ -0,0 +1,324 @@
+import json
+import time
+import threading
+import multiprocessing
+from collections import deque
+from backend import TrackMetadata
+from downloader import EarlyCancellations
+
+# Constants for configuration
+QUEUE_NAMESPACE = "spotify-dl"  # Prefix for all shared queue keys
+PRIORITY_LEVELS = 3  # Priorities 0 (most urgent) .. PRIORITY_LEVELS - 1
+REMOTE_WINDOW = 20  # Max jobs per task waiting in the shared queue at once
+RESULT_POLL_TIMEOUT = 1  # Seconds to block while waiting for a worker result
+JOB_QUEUE_TIMEOUT = 1800  # Seconds a job may wait in the shared queue before it is counted as failed
+JOB_RUN_TIMEOUT = 900  # Seconds a worker may spend on a job before it is counted as failed (e.g. the node died)
+RESULT_TTL = 3600  # Seconds a task's result list is kept in Redis without being read
+
+def job_to_dict(task_id, job_id, args):
+    """
+    Turn a download_youtube_audio argument tuple into a JSON-friendly job.
+
+    Args:
+        task_id: ID of the task the job belongs to
+        job_id: Position of the job within its task
+        args: A tuple containing (url, output_dir, audio_format, audio_quality, metadata, filename)
+    """
+    url, output_dir, audio_format, audio_quality, metadata, filename = args
+    return {
+        'task_id': task_id,
+        'job_id': job_id,
+        'url': url,
+        'output_dir': output_dir,
+        'format': audio_format,
+        'quality': audio_quality,
+        'metadata': vars(metadata) if metadata else None,
+        'filename': filename,
+    }
+
+def job_args(job):
+    """Rebuild the download_youtube_audio argument tuple from a job"""
+    metadata = TrackMetadata(**job['metadata']) if job['metadata'] else None
+    return (job['url'], job['output_dir'], job['format'], job['quality'], metadata, job['filename'])
+
+class RedisJobQueue:
+    """
+    Download job queue shared through Redis.
+    Jobs are kept in one list per priority and popped with BRPOP over all of
+    them in priority order; results go to a list per task (expiring once
+    nobody reads it) and cancelled task IDs to a set.
+    """
+    def __init__(self, redis_url, namespace=QUEUE_NAMESPACE):
+        self.redis_url = redis_url
+        self.namespace = namespace
+        self._client = None
+
+    def __getstate__(self):
+        # Worker processes open their own connection
+        return {'redis_url': self.redis_url, 'namespace': self.namespace, '_client': None}
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(self.redis_url)
+        return self._client
+
+    def _jobs_key(self, priority):
+        return f"{self.namespace}:jobs:{priority}"
+
+    def _results_key(self, task_id):
+        return f"{self.namespace}:results:{task_id}"
+
+    def push_job(self, priority, job):
+        priority = min(max(priority, 0), PRIORITY_LEVELS - 1)
+        self.client.lpush(self._jobs_key(priority), json.dumps(job))
+
+    def pop_job(self, timeout=1):
+        keys = [self._jobs_key(priority) for priority in range(PRIORITY_LEVELS)]
+        item = self.client.brpop(keys, timeout=timeout)
+        return json.loads(item[1]) if item else None
+
+    def remove_job(self, priority, job):
+        """Take a job back out of the queue; False if a worker already popped it"""
+        priority = min(max(priority, 0), PRIORITY_LEVELS - 1)
+        return self.client.lrem(self._jobs_key(priority), 1, json.dumps(job)) > 0
+
+    def report(self, task_id, result):
+        key = self._results_key(task_id)
+        pipeline = self.client.pipeline()
+        pipeline.rpush(key, json.dumps(result))
+        pipeline.expire(key, RESULT_TTL)
+        pipeline.execute()
+
+    def pop_result(self, task_id, timeout=RESULT_POLL_TIMEOUT):
+        item = self.client.blpop([self._results_key(task_id)], timeout=timeout)
+        return json.loads(item[1]) if item else None
+
+    def cancel(self, task_id):
+        self.client.sadd(f"{self.namespace}:cancelled", task_id)
+
+    def is_cancelled(self, task_id):
+        return bool(self.client.sismember(f"{self.namespace}:cancelled", task_id))
+
+    def clear_task(self, task_id):
+        self.client.srem(f"{self.namespace}:cancelled", task_id)
+        self.client.delete(self._results_key(task_id))
+
+class LocalJobQueue:
+    """
+    In-process stand-in for RedisJobQueue with the same interface.
+    Useful for tests and for running a worker loop inside the same process
+    as the front end.
+
+    Jobs and results stay in this process. Cancelled task IDs are kept in a
+    manager dict, so the download processes of run_worker (which receive a
+    copy of the queue) see cancellations made after they started.
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.jobs = [deque() for _ in range(PRIORITY_LEVELS)]
+        self.results = {}
+        self.manager = multiprocessing.Manager()
+        self.cancelled = self.manager.dict()
+
+    def __getstate__(self):
+        # Download processes only check for cancellations
+        return {'cancelled': self.cancelled}
+
+    def push_job(self, priority, job):
+        priority = min(max(priority, 0), PRIORITY_LEVELS - 1)
+        with self.condition:
+            self.jobs[priority].append(job)
+            self.condition.notify_all()
+
+    def pop_job(self, timeout=1):
+        deadline = time.time() + timeout
+        with self.condition:
+            while True:
+                for jobs in self.jobs:
+                    if jobs:
+                        return jobs.popleft()
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+
+    def remove_job(self, priority, job):
+        priority = min(max(priority, 0), PRIORITY_LEVELS - 1)
+        with self.condition:
+            try:
+                self.jobs[priority].remove(job)
+                return True
+            except ValueError:
+                return False
+
+    def report(self, task_id, result):
+        with self.condition:
+            self.results.setdefault(task_id, deque()).append(result)
+            self.condition.notify_all()
+
+    def pop_result(self, task_id, timeout=RESULT_POLL_TIMEOUT):
+        deadline = time.time() + timeout
+        with self.condition:
+            while not self.results.get(task_id):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+            return self.results[task_id].popleft()
+
+    def cancel(self, task_id):
+        self.cancelled[task_id] = True
+
+    def is_cancelled(self, task_id):
+        return task_id in self.cancelled
+
+    def clear_task(self, task_id):
+        self.cancelled.pop(task_id, None)
+        with self.condition:
+            self.results.pop(task_id, None)
+
+class RemoteTask:
+    """
+    Front-end state of a task whose downloads run on worker nodes.
+    """
+    def __init__(self, task_id, priority, args_list, callback):
+        self.id = task_id
+        self.priority = priority            # Lower values are popped first by workers
+        self.pending = deque(enumerate(args_list))  # Jobs not yet handed to the queue
+        self.outstanding = {}               # job_id -> [job, deadline, started] for jobs in the queue or on a worker
+        self.succeeded = 0                  # Jobs that finished successfully
+        self.callback = callback            # Called after each finished job
+        self.paused = False                 # Paused tasks stop feeding the queue
+        self.cancelled = False
+
+class RemoteScheduler:
+    """
+    Drop-in replacement for DownloadScheduler that hands jobs to worker nodes
+    through a shared job queue (see worker.py) instead of a local pool.
+
+    Each task keeps at most REMOTE_WINDOW jobs in the shared queue, so pausing
+    and cancelling take effect quickly and large tasks never bury small ones.
+
+    Every job handed out has a deadline: JOB_QUEUE_TIMEOUT until a worker
+    reports that it started it, then JOB_RUN_TIMEOUT until its result. A job
+    that misses its deadline (no worker running, or the node died mid-job)
+    is counted as failed, so a task always finishes.
+    """
+    def __init__(self, queue):
+        self.queue = queue
+        self.lock = threading.Lock()
+        self.tasks = {}                # task_id -> RemoteTask
+        self.cancelled_early = EarlyCancellations()  # Tasks cancelled before their jobs were queued
+
+    def run(self, task_id, args_list, priority, callback=None):
+        """
+        Queue a task's downloads for the workers and wait until they have all finished or been cancelled.
+
+        Args:
+            task_id: ID of the task the jobs belong to
+            args_list: Argument tuples for download_youtube_audio
+            priority: Scheduling priority, lower values run first
+            callback: Function to call after each download completes
+
+        Returns:
+            Number of successfully downloaded songs
+        """
+        task = RemoteTask(task_id, priority, args_list, callback)
+        with self.lock:
+            if self.cancelled_early.pop(task_id):
+                return 0
+            self.tasks[task_id] = task
+
+        try:
+            self._feed(task)
+            while task.outstanding or (task.pending and not task.cancelled):
+                result = self.queue.pop_result(task_id)
+                if result is not None:
+                    self._record_result(task, result)
+                self._expire_jobs(task)
+                self._feed(task)
+        finally:
+            with self.lock:
+                self.tasks.pop(task_id, None)
+            self.queue.clear_task(task_id)
+        return task.succeeded
+
+    def _feed(self, task):
+        # Top the task's jobs in the shared queue back up to the window size
+        while task.pending and not task.paused and not task.cancelled and len(task.outstanding) < REMOTE_WINDOW:
+            job_id, args = task.pending.popleft()
+            job = job_to_dict(task.id, job_id, args)
+            self.queue.push_job(task.priority, job)
+            task.outstanding[job_id] = [job, time.time() + JOB_QUEUE_TIMEOUT, False]
+
+    def _record_result(self, task, result):
+        entry = task.outstanding.get(result['job_id'])
+        if entry is None:
+            return  # Late report of a job that was already given up on
+        if result.get('started'):
+            entry[1] = time.time() + JOB_RUN_TIMEOUT
+            entry[2] = True
+            return
+        del task.outstanding[result['job_id']]
+        if result.get('success'):
+            task.succeeded += 1
+        if task.callback:
+            task.callback()
+
+    def _expire_jobs(self, task):
+        # Give up on jobs past their deadline; queued jobs of a cancelled task are taken back at once
+        now = time.time()
+        for job_id, entry in list(task.outstanding.items()):
+            job, deadline, started = entry
+            if started and now < deadline:
+                continue
+            if not started and not task.cancelled and now < deadline:
+                continue
+            if not started and not self.queue.remove_job(task.priority, job):
+                # A worker has just taken it; wait for its start report and result
+                entry[1] = now + JOB_RUN_TIMEOUT
+                entry[2] = True
+                continue
+            del task.outstanding[job_id]
+            if task.cancelled:
+                continue
+            print(f"Giving up on job {job_id} of task {task.id}: "
+                  + ("no worker reported a result" if started else "no worker picked it up"))
+            if task.callback:
+                task.callback()
+
+    def cancel(self, task_id):
+        """
+        Stop queueing a task's jobs and tell workers to abort the ones already handed out.
+        Cancelling a task that has not been queued yet makes its later run() return straight away.
+        """
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if not task:
+                self.cancelled_early.add(task_id)
+                return True
+            if task.cancelled:
+                return False
+            task.cancelled = True
+        self.queue.cancel(task_id)
+        return True
+
+    def pause(self, task_id):
+        """Stop handing a task's jobs to the workers; jobs already queued still run"""
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if not task or task.cancelled:
+                return False
+            task.paused = True
+            return True
+
+    def resume(self, task_id):
+        """Continue feeding a paused task's jobs to the workers"""
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if not task or task.cancelled:
+                return False
+            task.paused = False
+            return True
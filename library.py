@@ -0,0 +1,209 @@
+import os
+import re
+import json
+import threading
+
+# Constants for configuration
+INDEX_FILENAME = ".spotify-dl-index.json"  # Per-library filename index, stored in the output directory
+MAX_NAME_LENGTH = 180  # Keep generated names well below common filesystem limits
+
+# Characters that are not allowed (or are awkward) in filenames on common filesystems
+_UNSAFE_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+# One shared index object per output directory, so tasks writing to the same
+# library in this process see each other's reservations
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def sanitize_filename(name):
+    """Make a string safe to use as a filename component"""
+    name = _UNSAFE_CHARS.sub("_", name)
+    name = re.sub(r"\s+", " ", name).strip(" .")
+    return name[:MAX_NAME_LENGTH]
+
+def build_filename(metadata, audio_format):
+    """
+    Build a deterministic filename from Spotify metadata:
+    "Artist - Album - 01 - Title.ext" (empty fields are left out).
+    """
+    track_number = metadata.track_number.zfill(2) if metadata.track_number else ""
+    parts = [metadata.artist, metadata.album, track_number, metadata.title]
+    base = sanitize_filename(" - ".join(part for part in parts if part))
+    return f"{base or 'Unknown'}.{audio_format}"
+
+def track_key(url, metadata):
+    """Stable identity of a track in the index: the Spotify track ID, or the YouTube URL as a fallback"""
+    if metadata and metadata.track_id:
+        return metadata.track_id
+    return url
+
+class FilenameIndex:
+    """
+    Persistent mapping of track key -> filename for one output directory.
+    Names are reserved up front so two tracks can never overwrite each other,
+    and membership checks are dictionary lookups instead of directory scans.
+    The index also holds the sync point of every playlist downloaded into
+    the directory, so each library is synced on its own.
+    """
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, INDEX_FILENAME)
+        self.lock = threading.RLock()
+        self.entries = {}  # track key -> filename
+        self.owners = {}   # lower-cased filename -> track key (case-insensitive filesystems)
+        self.playlists = {}  # playlist ID -> {'snapshot_id': ..., 'track_ids': [...]} as of the last sync
+        # Changes made here since the last save, replayed on top of what other processes wrote
+        self.assigned = set()          # track keys given a name
+        self.removed = {}              # track key -> filename deleted
+        self.synced_playlists = set()  # playlist IDs with a new sync point
+        self.loaded_mtime = None
+        self._refresh()
+
+    def _read(self):
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable filename index {self.path}: {str(e)}")
+            return {}
+
+    def _mtime(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def _merge(self, data):
+        """The index on disk with this process's unsaved changes applied"""
+        entries = data.get("tracks", {})
+        for key, filename in self.removed.items():
+            if entries.get(key) == filename:
+                del entries[key]
+        for key in self.assigned:
+            entries[key] = self.entries[key]
+        playlists = data.get("playlists", {})
+        for playlist_id in self.synced_playlists:
+            playlists[playlist_id] = self.playlists[playlist_id]
+        self.entries = entries
+        self.playlists = playlists
+        self.owners = {filename.lower(): key for key, filename in entries.items()}
+
+    def _refresh(self):
+        # Pick up names and sync points written by other processes, e.g. a concurrent CLI run
+        mtime = self._mtime()
+        if mtime == self.loaded_mtime:
+            return
+        self._merge(self._read())
+        self.loaded_mtime = mtime
+
+    def save(self):
+        """Merge with the index on disk and write it back atomically next to the library files"""
+        with self.lock:
+            self._merge(self._read())
+            os.makedirs(self.output_dir, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as file:
+                json.dump({"tracks": self.entries, "playlists": self.playlists}, file, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self.assigned.clear()
+            self.removed.clear()
+            self.synced_playlists.clear()
+            self.loaded_mtime = self._mtime()
+
+    def filename_for(self, key):
+        with self.lock:
+            self._refresh()
+            return self.entries.get(key)
+
+    def is_complete(self, key):
+        """
+        Whether a track is already in the library.
+        Files are only ever renamed into place once finished, so an indexed
+        name that exists on disk is a complete download.
+        """
+        with self.lock:
+            self._refresh()
+            filename = self.entries.get(key)
+        return filename is not None and os.path.exists(os.path.join(self.output_dir, filename))
+
+    def assign(self, key, metadata, audio_format, fallback_name=None):
+        """
+        Reserve a filename for a track, resolving collisions with a " (n)" suffix.
+        A track keeps the name it was given on earlier runs.
+        """
+        with self.lock:
+            self._refresh()
+            filename = self.entries.get(key)
+            if filename and filename.endswith("." + audio_format):
+                return filename
+            if filename:
+                # Same track requested in another format; release the old name
+                self.owners.pop(filename.lower(), None)
+
+            if metadata:
+                candidate = build_filename(metadata, audio_format)
+            else:
+                candidate = f"{sanitize_filename(fallback_name or key) or 'Unknown'}.{audio_format}"
+            base, ext = os.path.splitext(candidate)
+            suffix = 1
+            while candidate.lower() in self.owners or os.path.exists(os.path.join(self.output_dir, candidate)):
+                suffix += 1
+                candidate = f"{base} ({suffix}){ext}"
+
+            self.entries[key] = candidate
+            self.owners[candidate.lower()] = key
+            self.assigned.add(key)
+            return candidate
+
+    def get_synced(self, playlist_id):
+        with self.lock:
+            self._refresh()
+            return self.playlists.get(playlist_id)
+
+    def put_synced(self, playlist_id, snapshot_id, track_ids):
+        with self.lock:
+            self.playlists[playlist_id] = {"snapshot_id": snapshot_id, "track_ids": track_ids}
+            self.synced_playlists.add(playlist_id)
+
+    def tracks_in_other_playlists(self, playlist_id):
+        """Track IDs that other playlists synced into this library still list"""
+        with self.lock:
+            self._refresh()
+            return {
+                track_id
+                for other_id, synced in self.playlists.items() if other_id != playlist_id
+                for track_id in synced.get("track_ids", [])
+            }
+
+    def remove(self, key):
+        """
+        Delete a track's file from the library and forget its name.
+        
+        Returns:
+            True if a file was deleted
+        """
+        with self.lock:
+            self._refresh()
+            filename = self.entries.pop(key, None)
+            if filename is None:
+                return False
+            self.owners.pop(filename.lower(), None)
+            self.assigned.discard(key)
+            self.removed[key] = filename
+            path = os.path.join(self.output_dir, filename)
+            if os.path.exists(path):
+                os.remove(path)
+                return True
+            return False
+
+def open_index(output_dir):
+    """Get the shared FilenameIndex for an output directory"""
+    output_dir = os.path.abspath(output_dir)
+    with _indexes_lock:
+        index = _indexes.get(output_dir)
+        if index is None:
+            index = FilenameIndex(output_dir)
+            _indexes[output_dir] = index
+        return index
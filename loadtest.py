@@ -0,0 +1,231 @@
+import os
+import re
+import time
+import uuid
+import shutil
+import argparse
+import tempfile
+import threading
+import multiprocessing
+import requests
+from werkzeug.serving import make_server, WSGIRequestHandler
+import app
+import backend
+import downloader
+from backend import TrackMetadata
+
+# Constants for configuration
+SAMPLE_INTERVAL = 1  # Seconds between resource samples
+TERMINAL_STATUSES = (*app.FINISHED_STATUSES, "not_found")  # Statuses that end a user's polling
+
+# Simulated latencies, set from the command line before the worker pool starts
+_lookup_latency = 0.0
+_download_latency = 0.0
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Request handler that keeps the server's access log out of the report"""
+    def log_request(self, *args, **kwargs):
+        pass
+
+def fake_songs(count, limit=None):
+    """Stand-in for a Spotify lookup: unique fake tracks after a simulated delay"""
+    time.sleep(_lookup_latency)
+    count = min(count, limit) if limit else count
+    run_id = uuid.uuid4().hex[:8]
+    urls = [f"https://www.youtube.com/watch?v={run_id}{i}" for i in range(count)]
+    metadata_list = [
+        TrackMetadata(f"Track {i}", "Load Test", run_id, "", str(i + 1), "", "", f"{run_id}-{i}")
+        for i in range(count)
+    ]
+    return urls, metadata_list, f"loadtest-{run_id}"
+
+def fake_download(args):
+    """Stand-in for download_youtube_audio: sleeps instead of fetching, honours cancellation"""
+    deadline = time.time() + _download_latency
+    while time.time() < deadline:
+        if backend.should_stop():
+            return False
+        time.sleep(min(0.05, max(deadline - time.time(), 0)))
+    return True
+
+def rss_megabytes():
+    """Resident memory of this process in MB (Linux), or None where unavailable"""
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)]
+
+class LoadTestStats:
+    """Thread-safe collection of request latencies, errors and progress checks"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}      # endpoint -> list of seconds
+        self.errors = {}         # endpoint -> count
+        self.problems = []       # progress-count correctness violations
+        self.tasks = 0
+        self.samples = []        # (elapsed, threads, processes, rss MB, tracked tasks)
+
+    def record(self, endpoint, seconds, ok=True):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def problem(self, message):
+        with self.lock:
+            self.problems.append(message)
+
+def timed(stats, endpoint, method, url, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = method(url, timeout=30, **kwargs)
+    except requests.RequestException:
+        stats.record(endpoint, time.perf_counter() - start, ok=False)
+        return None
+    stats.record(endpoint, time.perf_counter() - start, ok=response.status_code < 500)
+    return response
+
+def fake_user(base_url, user_id, options, stats, output_root):
+    """
+    One simulated user: submits downloads (every Nth one as a batch) and polls
+    /check_progress until each finishes, checking that the reported progress
+    never goes backwards, never exceeds the total and ends at the total.
+    """
+    session = requests.Session()
+    for round_number in range(options.rounds):
+        is_batch = options.batch_every and (user_id + round_number) % options.batch_every == 0
+        form = {
+            'url': "https://open.spotify.com/playlist/a\nhttps://open.spotify.com/playlist/b" if is_batch
+                   else "https://open.spotify.com/playlist/loadtest",
+            'format': 'mp3',
+            'quality': '192',
+            'output_dir': os.path.join(output_root, f"user{user_id}-{round_number}"),
+        }
+        if is_batch:
+            form['batch_mode'] = 'true'
+        endpoint = "POST /download (batch)" if is_batch else "POST /download"
+        if timed(stats, endpoint, session.post, f"{base_url}/download", data=form, allow_redirects=False) is None:
+            continue
+
+        # The page embeds the session's active task ID, just like for a browser
+        page = timed(stats, "GET /", session.get, f"{base_url}/")
+        match = re.search(r'const taskId = "([0-9a-f-]+)"', page.text) if page is not None else None
+        if not match:
+            stats.problem(f"user {user_id}: no task ID after submitting a download")
+            continue
+        task_id = match.group(1)
+        with stats.lock:
+            stats.tasks += 1
+
+        last_completed = 0
+        while True:
+            response = timed(stats, "GET /check_progress", session.get, f"{base_url}/check_progress/{task_id}")
+            data = response.json() if response is not None and response.status_code in (200, 404) else {}
+            status = data.get('status')
+            completed, total = data.get('completed', 0), data.get('total', 0)
+            if completed < last_completed:
+                stats.problem(f"task {task_id}: progress went back from {last_completed} to {completed}")
+            if status == "downloading" and completed > total:
+                stats.problem(f"task {task_id}: {completed} completed out of {total}")
+            last_completed = completed
+            if status in TERMINAL_STATUSES:
+                if status != "completed" or completed != total:
+                    stats.problem(f"task {task_id}: finished as {status} with {completed}/{total}")
+                break
+            time.sleep(options.poll_interval)
+
+def sample_resources(stats, start_time, stop_event):
+    """Record thread/process counts, memory and tracked tasks until stopped"""
+    while not stop_event.is_set():
+        sample = (time.time() - start_time, threading.active_count(), len(multiprocessing.active_children()),
+                  rss_megabytes(), len(app.download_tasks))
+        with stats.lock:
+            stats.samples.append(sample)
+        stop_event.wait(SAMPLE_INTERVAL)
+
+def print_report(stats, elapsed):
+    print(f"\n{stats.tasks} tasks in {elapsed:.1f}s")
+    print(f"{'endpoint':<26}{'count':>7}{'errors':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for endpoint, values in sorted(stats.latencies.items()):
+        print(f"{endpoint:<26}{len(values):>7}{stats.errors.get(endpoint, 0):>8}"
+              f"{percentile(values, 0.5) * 1000:>9.1f}{percentile(values, 0.9) * 1000:>9.1f}"
+              f"{percentile(values, 0.99) * 1000:>9.1f}{max(values) * 1000:>9.1f}")
+
+    print(f"\n{'time s':>7}{'threads':>9}{'procs':>7}{'rss MB':>9}{'tasks':>7}")
+    step = max(1, len(stats.samples) // 10)
+    for elapsed_s, threads, processes, rss, tasks in stats.samples[::step] + stats.samples[-1:]:
+        print(f"{elapsed_s:>7.1f}{threads:>9}{processes:>7}{(rss or 0):>9.1f}{tasks:>7}")
+    if stats.samples:
+        peak_threads = max(sample[1] for sample in stats.samples)
+        peak_processes = max(sample[2] for sample in stats.samples)
+        rss_values = [sample[3] for sample in stats.samples if sample[3] is not None]
+        growth = rss_values[-1] - rss_values[0] if rss_values else 0
+        print(f"Peak threads {peak_threads}, peak processes {peak_processes}, memory growth {growth:+.1f} MB")
+
+    if stats.problems:
+        print(f"\n{len(stats.problems)} progress-count problems:")
+        for message in stats.problems[:20]:
+            print(f"  {message}")
+    else:
+        print("\nProgress counts were consistent for every task.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the web app's task endpoints with simulated users and stubbed downloads")
+    parser.add_argument("-u", "--users", type=int, default=20, help="Number of concurrent simulated users")
+    parser.add_argument("-r", "--rounds", type=int, default=1, help="Downloads submitted by each user, one after another")
+    parser.add_argument("-s", "--songs", type=int, default=10, help="Songs returned per (stubbed) Spotify lookup")
+    parser.add_argument("--batch-every", type=int, default=5, help="Every Nth download is a two-URL batch (0 disables batches)")
+    parser.add_argument("--lookup-latency", type=float, default=0.2, help="Simulated Spotify/YouTube lookup time in seconds")
+    parser.add_argument("--download-latency", type=float, default=0.1, help="Simulated time per song download in seconds")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Seconds between /check_progress polls per user")
+    args = parser.parse_args()
+
+    # Stub out everything that would talk to Spotify or YouTube
+    _lookup_latency = args.lookup_latency
+    _download_latency = args.download_latency
+    app.get_songs_url = lambda url, limit=None, delta=True, output_dir=None: fake_songs(args.songs, limit)
+    app.download_user_library = lambda limit=None: fake_songs(args.songs, limit)
+    downloader.download_youtube_audio = fake_download
+
+    output_root = tempfile.mkdtemp(prefix="spotify-dl-loadtest-")
+    server = make_server("127.0.0.1", 0, app.app, threaded=True, request_handler=QuietRequestHandler)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    stats = LoadTestStats()
+    stop_sampling = threading.Event()
+    start_time = time.time()
+    sampler = threading.Thread(target=sample_resources, args=(stats, start_time, stop_sampling))
+    sampler.daemon = True
+    sampler.start()
+
+    print(f"Running {args.users} simulated users against {base_url}...")
+    try:
+        users = [
+            threading.Thread(target=fake_user, args=(base_url, user_id, args, stats, output_root))
+            for user_id in range(args.users)
+        ]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+    except KeyboardInterrupt:
+        print("\nLoad test interrupted. Reporting what was collected...")
+    finally:
+        stop_sampling.set()
+        sampler.join()
+        server.shutdown()
+        shutil.rmtree(output_root, ignore_errors=True)
+        print_report(stats, time.time() - start_time)
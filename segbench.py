@@ -0,0 +1,112 @@
+import os
+import sys
+import time
+import hashlib
+import argparse
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from segmented import probe_range_support, fetch_segmented
+
+# Constants for configuration
+SEND_CHUNK_SIZE = 64 * 1024  # Bytes written per throttling step
+
+class ThrottledRangeHandler(BaseHTTPRequestHandler):
+    """
+    Serves one in-memory blob with byte-range support, throttling every
+    connection to the same rate, like a media CDN that limits per-connection
+    throughput. Set `blob`, `rate` (bytes/s) and `latency` (s) on a subclass.
+    """
+    blob = b""
+    rate = 1024 * 1024
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        start, end = 0, len(self.blob) - 1
+        byte_range = self.headers.get('Range')
+        if byte_range and byte_range.startswith('bytes='):
+            first, _, last = byte_range[len('bytes='):].partition('-')
+            start = int(first)
+            end = min(int(last), end) if last else end
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(self.blob)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+        time.sleep(self.latency)
+        began = time.time()
+        sent = 0
+        try:
+            for offset in range(start, end + 1, SEND_CHUNK_SIZE):
+                chunk = self.blob[offset:min(offset + SEND_CHUNK_SIZE, end + 1)]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                # Stay at `rate` bytes per second on this connection
+                delay = began + sent / self.rate - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+def run_benchmark(url, blob_size, digest, segment_counts, work_dir, chunk_size=None):
+    """
+    Fetch the blob once per segment count and check the merged bytes.
+
+    Returns:
+        List of (segments, seconds, whether the merged file matched)
+    """
+    results = []
+    for segments in segment_counts:
+        dest_path = os.path.join(work_dir, f"fetch-{segments}.bin")
+        began = time.perf_counter()
+        fetch_segmented(url, dest_path, blob_size, segments, chunk_size=chunk_size)
+        elapsed = time.perf_counter() - began
+        with open(dest_path, 'rb') as file:
+            matched = hashlib.sha256(file.read()).hexdigest() == digest
+        os.remove(dest_path)
+        results.append((segments, elapsed, matched))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark segmented fetching against a local throttled HTTP server")
+    parser.add_argument("--size", type=float, default=24, help="Size of the served file in MiB")
+    parser.add_argument("--rate", type=float, default=8, help="Per-connection throughput limit in MiB/s")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated time to first byte per request in seconds")
+    parser.add_argument("--segments", type=int, nargs="+", default=[1, 2, 4, 8], help="Segment counts to compare")
+    parser.add_argument("--chunk-size", type=float, default=10, help="Largest range requested at once in MiB (yt-dlp's http_chunk_size for YouTube is 10; 0 for no limit)")
+    args = parser.parse_args()
+
+    blob = os.urandom(int(args.size * 1024 * 1024))
+    digest = hashlib.sha256(blob).hexdigest()
+    handler = type("Handler", (ThrottledRangeHandler,), {
+        'blob': blob, 'rate': args.rate * 1024 * 1024, 'latency': args.latency,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    url = f"http://127.0.0.1:{server.server_port}/stream"
+
+    try:
+        total_size = probe_range_support(url)
+        print(f"Serving {args.size:g} MiB at {args.rate:g} MiB/s per connection "
+              f"(range probe reported {total_size} bytes)")
+        with tempfile.TemporaryDirectory(prefix="spotify-dl-segbench-") as work_dir:
+            results = run_benchmark(url, len(blob), digest, args.segments, work_dir,
+                                    int(args.chunk_size * 1024 * 1024) or None)
+    finally:
+        server.shutdown()
+
+    baseline = results[0][1]
+    print(f"{'segments':>9}{'seconds':>9}{'speedup':>9}{'MiB/s':>8}  merged bytes")
+    for segments, elapsed, matched in results:
+        print(f"{segments:>9}{elapsed:>9.2f}{baseline / elapsed:>8.1f}x{args.size / elapsed:>8.1f}  "
+              f"{'match' if matched else 'MISMATCH'}")
+    sys.exit(0 if all(matched for _, _, matched in results) else 1)
@@ -0,0 +1,151 @@
+import os
+import shutil
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Constants for configuration
+SEGMENTED_MIN_SIZE = 8 * 1024 * 1024  # Streams smaller than this are fetched in one request
+SEGMENT_CHUNK_SIZE = 256 * 1024  # Bytes read per iteration of a segment transfer
+SEGMENT_TIMEOUT = 30  # Seconds before a stalled segment request fails
+SEGMENTED_PROTOCOLS = ("http", "https")  # yt-dlp protocols served as plain byte streams
+
+def probe_range_support(url, headers=None):
+    """
+    Check that a server honours byte ranges for a URL and get the full size.
+
+    Returns:
+        Size of the resource in bytes, or None if ranges are not supported
+    """
+    response = requests.get(url, headers={**(headers or {}), 'Range': 'bytes=0-0'}, stream=True, timeout=SEGMENT_TIMEOUT)
+    try:
+        content_range = response.headers.get('Content-Range', '')
+        if response.status_code != 206 or '/' not in content_range:
+            return None
+        total = content_range.rsplit('/', 1)[1]
+        return int(total) if total.isdigit() else None
+    finally:
+        response.close()
+
+def split_ranges(total_size, segments, chunk_size=None):
+    """
+    Split [0, total_size) into contiguous inclusive byte ranges: `segments` of
+    them, or more if that is needed to keep each one within `chunk_size` bytes.
+    """
+    if chunk_size:
+        segments = max(segments, -(-total_size // chunk_size))
+    segments = max(1, min(segments, total_size))
+    base, extra = divmod(total_size, segments)
+    ranges = []
+    start = 0
+    for i in range(segments):
+        length = base + (1 if i < extra else 0)
+        ranges.append((start, start + length - 1))
+        start += length
+    return ranges
+
+def _fetch_range(url, headers, start, end, part_path, should_stop):
+    # Download one inclusive byte range into its own part file
+    if should_stop():
+        raise InterruptedError("Download cancelled")
+    response = requests.get(url, headers={**headers, 'Range': f'bytes={start}-{end}'}, stream=True, timeout=SEGMENT_TIMEOUT)
+    try:
+        if response.status_code != 206:
+            raise IOError(f"Server ignored range {start}-{end} (HTTP {response.status_code})")
+        written = 0
+        with open(part_path, 'wb') as part:
+            for chunk in response.iter_content(SEGMENT_CHUNK_SIZE):
+                if should_stop():
+                    raise InterruptedError("Download cancelled")
+                part.write(chunk)
+                written += len(chunk)
+        if written != end - start + 1:
+            raise IOError(f"Range {start}-{end} ended early after {written} bytes")
+    finally:
+        response.close()
+
+def fetch_segmented(url, dest_path, total_size, segments, headers=None, should_stop=None, chunk_size=None):
+    """
+    Download a resource with `segments` concurrent range requests and merge the parts.
+    With `chunk_size`, the resource is cut into ranges of at most that many bytes
+    and the `segments` connections work through them in order.
+
+    Args:
+        url: URL of the resource (must support byte ranges)
+        dest_path: Where the merged file is written
+        total_size: Size of the resource in bytes
+        segments: Number of concurrent range requests
+        headers: Extra HTTP headers for every request
+        should_stop: Optional callable; the transfer is aborted once it returns True
+        chunk_size: Largest range requested at once (servers may throttle or reject bigger ones)
+    """
+    headers = headers or {}
+    ranges = split_ranges(total_size, segments, chunk_size)
+    part_paths = [f"{dest_path}.seg{i}" for i in range(len(ranges))]
+    # Once one range fails, the others stop instead of fetching data that will be thrown away
+    failed = threading.Event()
+    def stop():
+        return failed.is_set() or bool(should_stop and should_stop())
+    try:
+        with ThreadPoolExecutor(max_workers=min(segments, len(ranges))) as executor:
+            futures = [
+                executor.submit(_fetch_range, url, headers, start, end, part_path, stop)
+                for (start, end), part_path in zip(ranges, part_paths)
+            ]
+            for future in as_completed(futures):
+                if future.exception():
+                    failed.set()
+                    raise future.exception()
+
+        # Merge the parts in order once all of them are complete
+        with open(dest_path, 'wb') as dest:
+            for part_path in part_paths:
+                with open(part_path, 'rb') as part:
+                    shutil.copyfileobj(part, dest, SEGMENT_CHUNK_SIZE)
+    except BaseException:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+    finally:
+        for part_path in part_paths:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+def prefetch_stream(ydl, info_dict, segments, should_stop=None):
+    """
+    Fetch the format yt-dlp selected with parallel range requests, to the path
+    yt-dlp will look for it, so that ydl.process_info only post-processes it.
+    Only plain HTTP(S) streams of at least SEGMENTED_MIN_SIZE bytes on servers
+    that honour ranges are prefetched; anything else (including a failed
+    range probe or segment transfer) is left to yt-dlp. Ranges stay within the
+    format's http_chunk_size, like yt-dlp's own requests.
+
+    Returns:
+        True if the stream was prefetched
+    """
+    if segments <= 1 or info_dict.get('protocol') not in SEGMENTED_PROTOCOLS or not info_dict.get('url'):
+        return False
+    expected_size = info_dict.get('filesize') or info_dict.get('filesize_approx')
+    if expected_size and expected_size < SEGMENTED_MIN_SIZE:
+        return False
+
+    headers = info_dict.get('http_headers') or {}
+    try:
+        total_size = probe_range_support(info_dict['url'], headers)
+    except requests.RequestException:
+        # Let yt-dlp's own downloader (and its retries) deal with the stream
+        return False
+    if not total_size or total_size < SEGMENTED_MIN_SIZE:
+        return False
+
+    chunk_size = (info_dict.get('downloader_options') or {}).get('http_chunk_size')
+    try:
+        fetch_segmented(info_dict['url'], ydl.prepare_filename(info_dict), total_size, segments,
+                        headers, should_stop, chunk_size)
+    except InterruptedError:
+        raise
+    except (requests.RequestException, IOError) as e:
+        # Partial files are already cleaned up; yt-dlp fetches the stream from scratch
+        print(f"Segmented download failed, falling back to a single stream: {str(e)}")
+        return False
+    return True
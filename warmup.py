@@ -0,0 +1,135 @@
+import os
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from backend import sp, track_cache, get_track_metadata, get_youtube_url
+
+# Constants for configuration
+WARMUP_INTERVAL = 3600  # Seconds between warmup runs
+WARMUP_PAGE_SIZE = 100  # Tracks per Spotify playlist page
+WARMUP_SEARCH_WORKERS = 10  # Parallel YouTube searches per playlist
+
+# Failed matches each playlist was last listed with, so an unchanged playlist is
+# only listed again for failures that are new since then
+_checked_failures = {}
+
+def playlist_id_from_url(url):
+    """Extract the playlist ID from a Spotify playlist URL"""
+    url = url.strip().split("?")[0]
+    if "playlist" not in url:
+        raise ValueError(f"Not a Spotify playlist URL: {url}")
+    return url.rstrip("/").split("/")[-1]
+
+def read_watchlist(path):
+    """Read playlist URLs from a file, one per line ('#' starts a comment)"""
+    with open(path) as file:
+        return [line.strip() for line in file if line.strip() and not line.startswith("#")]
+
+def warm_playlist(url):
+    """
+    Pre-resolve metadata and YouTube matches for new tracks of a playlist.
+    The full track listing is only fetched when the playlist's snapshot ID
+    has changed since the last warmup, or when a cached YouTube match failed
+    to download since then.
+
+    Args:
+        url: Spotify playlist URL
+
+    Returns:
+        Number of tracks newly added to the cache
+    """
+    playlist_id = playlist_id_from_url(url)
+    playlist = sp.playlist(playlist_id, fields="snapshot_id,name,tracks.total")
+    # Unchanged playlists are skipped, unless a cached match failed to download since they
+    # were last listed (the cache does not know which playlists the failed track is on)
+    failed_ids = track_cache.failed_track_ids()
+    if track_cache.get_snapshot(playlist_id) == playlist['snapshot_id'] and failed_ids <= _checked_failures.get(playlist_id, set()):
+        return 0
+
+    items = []
+    for offset in range(0, playlist['tracks']['total'], WARMUP_PAGE_SIZE):
+        results = sp.playlist_tracks(playlist_id, offset=offset, limit=WARMUP_PAGE_SIZE)
+        items.extend(results['items'])
+
+    # Skip local files/removed tracks and anything that is already warm
+    new_items = [
+        item for item in items
+        if item.get('track') and item['track'].get('id') and not track_cache.is_warm(item['track']['id'])
+    ]
+
+    for item in new_items:
+        get_track_metadata(item, "playlist")
+
+    with ThreadPoolExecutor(max_workers=WARMUP_SEARCH_WORKERS) as executor:
+        for item in new_items:
+            track = item['track']
+            executor.submit(get_youtube_url, track['name'], track['artists'][0]['name'], track_id=track['id'])
+
+    _checked_failures[playlist_id] = failed_ids
+
+    # Only remember the snapshot once every track resolved, so failed lookups are retried next time
+    if all(track_cache.is_warm(item['track']['id']) for item in new_items):
+        track_cache.put_snapshot(playlist_id, playlist['snapshot_id'])
+    track_cache.save()
+    print(f"Warmed {len(new_items)} new tracks of '{playlist['name']}'")
+    return len(new_items)
+
+def warm_playlists(urls):
+    """Run one warmup pass over all watched playlists, continuing past failures"""
+    warmed = 0
+    for url in urls:
+        try:
+            warmed += warm_playlist(url)
+        except Exception as e:
+            print(f"Error warming up {url}: {str(e)}")
+    return warmed
+
+def run_warmup(urls, interval=WARMUP_INTERVAL, stop_event=None):
+    """
+    Warm the watched playlists every `interval` seconds until stop_event is set.
+
+    Args:
+        urls: List of playlist URLs, or a callable returning one (re-read every pass)
+        interval: Seconds between warmup passes
+        stop_event: Optional threading.Event that stops the loop when set
+    """
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        warm_playlists(urls() if callable(urls) else urls)
+        stop_event.wait(interval)
+
+def start_warmup_scheduler(urls, interval=WARMUP_INTERVAL):
+    """
+    Start periodic warmup in a daemon thread (used by the web app).
+
+    Returns:
+        threading.Event that stops the scheduler when set
+    """
+    stop_event = threading.Event()
+    thread = threading.Thread(target=run_warmup, args=(urls, interval, stop_event))
+    thread.daemon = True
+    thread.start()
+    return stop_event
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-resolve metadata and YouTube matches for watched Spotify playlists")
+    parser.add_argument("urls", nargs="*", help="Spotify playlist URLs to watch")
+    parser.add_argument("-w", "--watchlist", default=os.environ.get("SPOTIFY_DL_WATCHLIST"), help="File with playlist URLs, one per line")
+    parser.add_argument("-i", "--interval", type=int, default=WARMUP_INTERVAL, help="Seconds between warmup runs")
+    parser.add_argument("--once", action="store_true", help="Run a single warmup pass and exit")
+    args = parser.parse_args()
+
+    def watched_urls():
+        return args.urls + (read_watchlist(args.watchlist) if args.watchlist else [])
+
+    if not watched_urls():
+        parser.error("No playlists to watch. Pass playlist URLs or --watchlist.")
+
+    try:
+        if args.once:
+            print(f"Warmed {warm_playlists(watched_urls())} tracks in total.")
+        else:
+            print(f"Warming up {len(watched_urls())} playlists every {args.interval} seconds...")
+            run_warmup(watched_urls, args.interval)
+    except KeyboardInterrupt:
+        print("\nWarmup interrupted. Exiting...")
@@ -0,0 +1,123 @@
+import os
+import time
+import argparse
+import threading
+import multiprocessing
+from backend import download_youtube_audio, init_worker, set_cancel_check, staging_root, MAX_CONCURRENT_WRITES, STAGING_DIR, DOWNLOAD_SEGMENTS
+from jobqueue import RedisJobQueue, job_args, QUEUE_NAMESPACE
+
+# Constants for configuration
+REDIS_URL = os.environ.get("SPOTIFY_DL_REDIS_URL", "redis://localhost:6379/0")  # Shared job queue
+CANCEL_CHECK_INTERVAL = 1  # Seconds between cancellation checks during a download
+
+# Job queue used by this worker process, set by init_remote_worker
+_queue = None
+
+def init_remote_worker(queue, write_semaphore, staging_dir, segments=None):
+    """
+    Pool initializer for download processes on a worker node.
+
+    Args:
+        queue: Job queue the node pulls from (used for cancellation checks)
+        write_semaphore: Shared budget for writes into output directories
+        staging_dir: Scratch directory for fetch/transcode/tagging (optional)
+        segments: Parallel byte ranges/fragments per audio stream (optional)
+    """
+    global _queue
+    init_worker(write_semaphore, staging_dir, segments)
+    _queue = queue
+
+def run_remote_job(job):
+    """
+    Download one job pulled from the shared queue.
+
+    Args:
+        job: Job dictionary as produced by jobqueue.job_to_dict
+
+    Returns:
+        Boolean indicating whether the download was successful
+    """
+    task_id = job['task_id']
+    last_check = [0, False]
+
+    # Ask the queue at most once per CANCEL_CHECK_INTERVAL whether the task was cancelled
+    def cancelled():
+        now = time.time()
+        if now - last_check[0] >= CANCEL_CHECK_INTERVAL:
+            last_check[0] = now
+            last_check[1] = _queue.is_cancelled(task_id)
+        return last_check[1]
+
+    set_cancel_check(cancelled)
+    try:
+        return download_youtube_audio(job_args(job))
+    finally:
+        set_cancel_check(None)
+
+def run_worker(queue, num_processes, staging_dir=None, max_writes=MAX_CONCURRENT_WRITES, stop_event=None,
+               segments=DOWNLOAD_SEGMENTS):
+    """
+    Pull download jobs from the shared queue and report each result back.
+    Only as many jobs as there are processes are taken at a time, so jobs
+    stay in the shared queue (in priority order) for other nodes.
+
+    Args:
+        queue: Job queue to pull from (RedisJobQueue or LocalJobQueue)
+        num_processes: Number of simultaneous download processes to use
+        staging_dir: Scratch directory for fetch/transcode/tagging (optional)
+        max_writes: Max number of processes moving files into output directories at once
+        stop_event: Optional threading.Event that stops the loop when set
+        segments: Parallel byte ranges/fragments per audio stream
+    """
+    slots = threading.Semaphore(num_processes)
+
+    def report(job, success):
+        queue.report(job['task_id'], {'job_id': job['job_id'], 'success': bool(success)})
+        slots.release()
+
+    write_semaphore = multiprocessing.Semaphore(max_writes)
+    # The pool exits (or is terminated) before the staging root is removed
+    with staging_root(staging_dir) as run_staging_dir, \
+            multiprocessing.Pool(processes=num_processes, initializer=init_remote_worker,
+                                 initargs=(queue, write_semaphore, run_staging_dir, segments)) as pool:
+        while not (stop_event and stop_event.is_set()):
+            slots.acquire()
+            job = queue.pop_job(timeout=1)
+            if job is None:
+                slots.release()
+                continue
+
+            # Jobs of cancelled tasks are reported back without being downloaded
+            if queue.is_cancelled(job['task_id']):
+                report(job, False)
+                continue
+
+            # Starts the job's run deadline on the front end
+            queue.report(job['task_id'], {'job_id': job['job_id'], 'started': True})
+
+            pool.apply_async(
+                run_remote_job, (job,),
+                callback=lambda result, job=job: report(job, result),
+                error_callback=lambda error, job=job: report(job, False)
+            )
+
+        # Let jobs already taken from the queue finish and report back
+        pool.close()
+        pool.join()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a download worker that pulls jobs from the shared queue")
+    parser.add_argument("--redis-url", default=REDIS_URL, help="Redis URL of the shared job queue")
+    parser.add_argument("--namespace", default=QUEUE_NAMESPACE, help="Key prefix of the shared job queue")
+    parser.add_argument("-p", "--processes", type=int, default=min(multiprocessing.cpu_count(), 5), help="Number of simultaneous downloads")
+    parser.add_argument("--staging-dir", default=STAGING_DIR, help="Scratch directory (e.g. a tmpfs) used while fetching, transcoding and tagging")
+    parser.add_argument("--max-writes", type=int, default=MAX_CONCURRENT_WRITES, help="Max number of files moved into output directories at once")
+    parser.add_argument("--segments", type=int, default=DOWNLOAD_SEGMENTS, help="Parallel byte ranges/fragments per audio stream (1 to disable)")
+    args = parser.parse_args()
+
+    print(f"Worker pulling jobs from {args.redis_url} with {args.processes} processes...")
+    try:
+        run_worker(RedisJobQueue(args.redis_url, args.namespace), args.processes,
+                   args.staging_dir, args.max_writes, segments=args.segments)
+    except KeyboardInterrupt:
+        print("\nWorker interrupted. Exiting...")
@@ -0,0 +1,127 @@
+import sys
+import time
+import argparse
+import threading
+import backend
+import worker
+import jobqueue
+from jobqueue import LocalJobQueue, RemoteScheduler
+
+def fake_download(args):
+    """
+    Stand-in for download_youtube_audio: sleeps instead of fetching, honours cancellation.
+    The simulated download time is encoded in the job URL (see make_jobs).
+    """
+    url = args[0]
+    deadline = time.time() + float(url.split("/")[-2])
+    while time.time() < deadline:
+        if backend.should_stop():
+            return False
+        time.sleep(min(0.05, max(deadline - time.time(), 0)))
+    return True
+
+def make_jobs(count, latency):
+    """Argument tuples for `count` fake downloads taking `latency` seconds each"""
+    return [
+        (f"https://example.invalid/{latency}/{i}", "unused", "mp3", "192", None, f"{i}.mp3")
+        for i in range(count)
+    ]
+
+class TaskRun:
+    """Runs one scheduler task in a thread, counting progress callbacks"""
+    def __init__(self, scheduler, task_id, args_list):
+        self.completed = 0
+        self.succeeded = None
+        self.finished_at = None
+        self.thread = threading.Thread(target=self._run, args=(scheduler, task_id, args_list))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _progress(self):
+        self.completed += 1
+
+    def _run(self, scheduler, task_id, args_list):
+        self.succeeded = scheduler.run(task_id, args_list, 1, self._progress)
+        self.finished_at = time.time()
+
+    def wait(self, timeout):
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+def check(results, name, passed, detail):
+    results.append(passed)
+    print(f"{'PASS' if passed else 'FAIL'}  {name}: {detail}")
+
+def check_completion(scheduler, options, results):
+    run = TaskRun(scheduler, "completion", make_jobs(options.songs, options.latency))
+    finished = run.wait(options.songs * options.latency + 30)
+    check(results, "completion", finished and run.succeeded == options.songs and run.completed == options.songs,
+          f"{run.succeeded} succeeded, {run.completed} progress updates out of {options.songs}")
+
+def check_pause(scheduler, options, results):
+    run = TaskRun(scheduler, "pause", make_jobs(options.songs, options.latency))
+    time.sleep(options.latency / 2)
+    scheduler.pause("pause")
+
+    # Jobs already in the shared queue (one window) still run; after that progress must stop
+    time.sleep((jobqueue.REMOTE_WINDOW / options.processes + 2) * options.latency)
+    held_at = run.completed
+    time.sleep(2 * options.latency)
+    stalled = run.completed == held_at and held_at < options.songs
+
+    scheduler.resume("pause")
+    finished = run.wait(options.songs * options.latency + 30)
+    check(results, "pause", stalled and finished and run.succeeded == options.songs,
+          f"held at {held_at}/{options.songs} while paused, {run.succeeded} succeeded after resuming")
+
+def check_cancel(scheduler, options, results):
+    # Downloads far longer than the check interval, so finishing early means in-flight jobs were aborted
+    latency = options.cancel_latency
+    run = TaskRun(scheduler, "cancel", make_jobs(options.songs, latency))
+    time.sleep(1)
+    cancelled_at = time.time()
+    scheduler.cancel("cancel")
+    finished = run.wait(latency + 30)
+    took = run.finished_at - cancelled_at if finished else None
+    check(results, "cancel", finished and run.succeeded == 0 and took < latency / 2,
+          f"run returned {took:.1f}s after cancelling with {run.succeeded} succeeded" if finished else "run never returned")
+
+def check_lost_jobs(scheduler, options, results):
+    # With no worker running, jobs must be given up on once they pass their queue deadline
+    jobqueue.JOB_QUEUE_TIMEOUT = 1
+    run = TaskRun(scheduler, "lost", make_jobs(3, options.latency))
+    finished = run.wait(30)
+    check(results, "lost jobs", finished and run.succeeded == 0 and run.completed == 3,
+          f"{run.completed} jobs counted as failed without a worker" if finished else "run never returned")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive run_worker with the local job queue through completion, pause and cancel")
+    parser.add_argument("-p", "--processes", type=int, default=2, help="Worker processes")
+    parser.add_argument("-s", "--songs", type=int, default=8, help="Songs per task")
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated time per song download in seconds")
+    parser.add_argument("--cancel-latency", type=float, default=10, help="Simulated time per song in the cancellation check")
+    parser.add_argument("--window", type=int, default=2, help="Jobs per task kept in the shared queue (REMOTE_WINDOW)")
+    args = parser.parse_args()
+
+    # Stub out the actual download; worker processes inherit this when they are forked
+    worker.download_youtube_audio = fake_download
+    jobqueue.REMOTE_WINDOW = args.window
+
+    queue = LocalJobQueue()
+    scheduler = RemoteScheduler(queue)
+    stop_worker = threading.Event()
+    worker_thread = threading.Thread(target=worker.run_worker, args=(queue, args.processes), kwargs={'stop_event': stop_worker})
+    worker_thread.daemon = True
+    worker_thread.start()
+
+    results = []
+    check_completion(scheduler, args, results)
+    check_pause(scheduler, args, results)
+    check_cancel(scheduler, args, results)
+
+    stop_worker.set()
+    worker_thread.join()
+    check_lost_jobs(scheduler, args, results)
+
+    print(f"\n{sum(results)} out of {len(results)} checks passed")
+    sys.exit(0 if all(results) else 1)